@@ -0,0 +1,197 @@
+"""
+Метрики в текстовом формате Prometheus для /api/metrics/.
+
+Каждый процесс копит значения в памяти. Если задан METRICS_DIR, процесс
+не чаще раза в METRICS_FLUSH_INTERVAL секунд атомарно переписывает
+свой файл <pid>.json в этом каталоге, а при выдаче метрик суммируются
+файлы всех воркеров gunicorn — какой бы воркер ни ответил на запрос.
+Файлы остановленных воркеров остаются, чтобы счётчики не убывали;
+каталог стоит очищать при запуске сервиса. Без METRICS_DIR метрики
+видны только в пределах процесса (runserver, один воркер).
+"""
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+# Имя -> (тип, описание, границы корзин для гистограмм).
+METRICS = {
+    'foodgram_request_duration_seconds': (
+        'histogram',
+        'Время обработки запроса по обработчикам API.',
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    ),
+    'foodgram_request_queries': (
+        'histogram',
+        'Число SQL-запросов на запрос к API.',
+        (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+    ),
+    'foodgram_responses_total': (
+        'counter',
+        'Ответы по обработчикам и кодам (304 — попадания по ETag).',
+        None,
+    ),
+    'foodgram_shopping_list_pdf_total': (
+        'counter',
+        'Запросы PDF списка покупок: из кэша на диске (hit), сборка (miss)'
+        ' или ошибка сборки (error).',
+        None,
+    ),
+    'foodgram_image_upload_bytes': (
+        'histogram',
+        'Размер загруженных картинок после декодирования base64.',
+        (16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20, 16 << 20),
+    ),
+}
+
+_lock = threading.Lock()
+_values = {}
+_last_flush = 0.0
+
+
+def _key(name, labels):
+    return json.dumps([name, sorted(labels.items())], ensure_ascii=False)
+
+
+def observe(name, value, **labels):
+    """Добавляет наблюдение в гистограмму name."""
+    buckets = METRICS[name][2]
+    key = _key(name, labels)
+    with _lock:
+        entry = _values.get(key)
+        if entry is None:
+            entry = _values[key] = {
+                'buckets': [0] * (len(buckets) + 1), 'sum': 0, 'count': 0
+            }
+        index = next(
+            (i for i, bound in enumerate(buckets) if value <= bound),
+            len(buckets)
+        )
+        entry['buckets'][index] += 1
+        entry['sum'] += value
+        entry['count'] += 1
+
+
+def inc(name, amount=1, **labels):
+    """Увеличивает счётчик name."""
+    key = _key(name, labels)
+    with _lock:
+        _values[key] = _values.get(key, 0) + amount
+
+
+def reset():
+    with _lock:
+        _values.clear()
+
+
+def _own_file():
+    return Path(settings.METRICS_DIR) / f'{os.getpid()}.json'
+
+
+def flush(force=False):
+    """Записывает значения процесса в METRICS_DIR, если он задан."""
+    global _last_flush
+    if not settings.METRICS_DIR:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < settings.METRICS_FLUSH_INTERVAL:
+        return
+    with _lock:
+        data = json.dumps(_values, ensure_ascii=False)
+        _last_flush = now
+    path = _own_file()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f'.{threading.get_ident()}.tmp')
+    tmp.write_text(data, encoding='utf-8')
+    os.replace(tmp, path)
+
+
+def _merge(total, values):
+    for key, value in values.items():
+        if isinstance(value, dict):
+            entry = total.setdefault(key, {
+                'buckets': [0] * len(value['buckets']), 'sum': 0, 'count': 0
+            })
+            entry['buckets'] = [
+                a + b for a, b in zip(entry['buckets'], value['buckets'])
+            ]
+            entry['sum'] += value['sum']
+            entry['count'] += value['count']
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def collect():
+    """Значения всех воркеров (или только текущего процесса)."""
+    if not settings.METRICS_DIR:
+        with _lock:
+            return json.loads(json.dumps(_values))
+    flush(force=True)
+    total = {}
+    for path in Path(settings.METRICS_DIR).glob('*.json'):
+        try:
+            _merge(total, json.loads(path.read_text(encoding='utf-8')))
+        except (OSError, ValueError):
+            # Файл удалили или воркер пишет его прямо сейчас.
+            continue
+    return total
+
+
+def _escape(value):
+    return (
+        str(value).replace('\\', r'\\').replace('"', r'\"')
+        .replace('\n', r'\n')
+    )
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(extra=()):
+    """
+    Текст для Prometheus. extra — дополнительные метрики, которые не
+    копятся здесь: (имя, тип, описание, [(метки, значение), ...]).
+    """
+    series = {}
+    for key, value in collect().items():
+        name, pairs = json.loads(key)
+        series.setdefault(name, []).append(
+            ([tuple(pair) for pair in pairs], value))
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        if name not in series:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for pairs, value in sorted(series[name]):
+            if kind == 'counter':
+                lines.append(f'{name}{_labels(pairs)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(
+                    (*buckets, math.inf), value['buckets']):
+                cumulative += count
+                le = ('le', _number(float(bound)))
+                lines.append(
+                    f'{name}_bucket{_labels([*pairs, le])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(pairs)} {_number(value["sum"])}')
+            lines.append(f'{name}_count{_labels(pairs)} {value["count"]}')
+    for name, kind, help_text, samples in extra:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for pairs, value in samples:
+            lines.append(f'{name}{_labels(pairs)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
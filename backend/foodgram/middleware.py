@@ -0,0 +1,207 @@
+"""
+Профилирование запросов: время обработки, число и время SQL-запросов.
+
+Включается REQUEST_PROFILING. Выключенный middleware отказывается от
+себя при загрузке (MiddlewareNotUsed) и ничего не стоит. Включённый
+добавляет к ответу заголовок Server-Timing, пишет в лог
+foodgram.profiling медленные запросы вместе с их SQL и одинаковые
+запросы, повторённые REQUEST_PROFILING_REPEATED_QUERIES раз и больше,
+— вероятный N+1.
+
+SQL считает обёртка из connection.execute_wrapper, которая вешается на
+каждое соединение один раз, а запрос находит через contextvar —
+так учитываются и запросы из sync_to_async в асинхронных view.
+Тот же профиль запроса использует MetricsMiddleware (METRICS_ENABLED,
+по умолчанию выключен); без REQUEST_PROFILING профиль хранит только
+число и время запросов, без их SQL.
+"""
+import contextvars
+import logging
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+logger = logging.getLogger('foodgram.profiling')
+
+current_profile = contextvars.ContextVar('request_profile', default=None)
+
+# Сколько SQL-запросов выводить в лог медленного запроса.
+LOGGED_QUERIES = 50
+
+
+class RequestProfile:
+    """
+    Число и время SQL-запросов запроса. Тексты запросов (для лога
+    медленных запросов и N+1) хранятся, только если включён
+    REQUEST_PROFILING: метрикам хватает числа и суммарного времени.
+    """
+
+    def __init__(self, keep_sql=False):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.sql_seconds = 0.0
+        self.queries = [] if keep_sql else None
+
+    def add_query(self, sql, seconds):
+        self.query_count += 1
+        self.sql_seconds += seconds
+        if self.queries is not None:
+            self.queries.append((sql, seconds))
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    def repeated_queries(self, threshold):
+        counts = Counter(sql for sql, _ in self.queries or ())
+        return [
+            (sql, count) for sql, count in counts.most_common()
+            if count >= threshold
+        ]
+
+
+def record_query(execute, sql, params, many, context):
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - start)
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def view_label(request):
+    """
+    Имя обработчика: «RecipeViewSet.list» для DRF-viewset'ов,
+    имя функции для остальных view.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    func = match.func
+    cls = getattr(func, 'cls', None)
+    if cls is None:
+        return getattr(func, '__name__', match.view_name)
+    method = request.method.lower()
+    action = (getattr(func, 'actions', None) or {}).get(method, method)
+    return f'{cls.__name__}.{action}'
+
+
+class ProfileMiddleware:
+    """
+    Общая часть middleware, которым нужен RequestProfile запроса.
+    Если профиль уже завёл внешний middleware, используется он.
+    """
+    sync_capable = True
+    async_capable = True
+    # Настройка, которая включает middleware.
+    setting = None
+
+    def __init__(self, get_response):
+        if not getattr(settings, self.setting):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        connection_created.connect(install_query_recorder)
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection=connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profile = current_profile.get()
+        token = None
+        if profile is None:
+            profile = RequestProfile(settings.REQUEST_PROFILING)
+            token = current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            if token is not None:
+                current_profile.reset(token)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        profile = current_profile.get()
+        token = None
+        if profile is None:
+            profile = RequestProfile(settings.REQUEST_PROFILING)
+            token = current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token is not None:
+                current_profile.reset(token)
+        return self.finish(request, response, profile)
+
+    def finish(self, request, response, profile):
+        """Обработка профиля готового ответа; по умолчанию ничего."""
+        return response
+
+
+class MetricsMiddleware(ProfileMiddleware):
+    """Время, число SQL-запросов и коды ответов для /api/metrics/."""
+    setting = 'METRICS_ENABLED'
+
+    def finish(self, request, response, profile):
+        action = view_label(request)
+        metrics.observe(
+            'foodgram_request_duration_seconds', profile.seconds,
+            action=action, method=request.method)
+        metrics.observe(
+            'foodgram_request_queries', profile.query_count,
+            action=action, method=request.method)
+        metrics.inc(
+            'foodgram_responses_total',
+            action=action, method=request.method,
+            status=response.status_code)
+        metrics.flush()
+        return response
+
+
+class RequestProfilingMiddleware(ProfileMiddleware):
+    setting = 'REQUEST_PROFILING'
+
+    def finish(self, request, response, profile):
+        seconds = profile.seconds
+        count = profile.query_count
+        response['Server-Timing'] = (
+            f'app;dur={seconds * 1000:.1f}, '
+            f'db;dur={profile.sql_seconds * 1000:.1f};desc="{count} SQL"'
+        )
+        label = view_label(request)
+        if (seconds * 1000 >= settings.REQUEST_PROFILING_SLOW_MS
+                or count >= settings.REQUEST_PROFILING_SLOW_QUERIES):
+            logger.warning(
+                'Медленный запрос %s %s (%s): %.1f мс, SQL: %d за %.1f мс\n%s',
+                request.method, request.get_full_path(), label,
+                seconds * 1000, count, profile.sql_seconds * 1000,
+                '\n'.join(
+                    f'{duration * 1000:8.2f} мс  {sql}'
+                    for sql, duration in (profile.queries or ())[
+                        :LOGGED_QUERIES]
+                )
+            )
+        repeated = profile.repeated_queries(
+            settings.REQUEST_PROFILING_REPEATED_QUERIES)
+        for sql, times in repeated:
+            logger.warning(
+                'Возможный N+1 в %s %s (%s): %d одинаковых запросов\n%s',
+                request.method, request.path, label, times, sql
+            )
+        return response
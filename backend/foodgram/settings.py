@@ -48,6 +48,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первыми, чтобы учитывать время всех остальных middleware.
+    'foodgram.middleware.MetricsMiddleware',
+    'foodgram.middleware.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,7 +60,35 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'foodgram.urls'
+# Профилирование запросов (foodgram/middleware.py): Server-Timing,
+# лог медленных запросов с их SQL и повторяющихся запросов (N+1).
+REQUEST_PROFILING = os.getenv('REQUEST_PROFILING', 'False') == 'True'
+REQUEST_PROFILING_SLOW_MS = int(
+    os.getenv('REQUEST_PROFILING_SLOW_MS', '500')
+)
+REQUEST_PROFILING_SLOW_QUERIES = int(
+    os.getenv('REQUEST_PROFILING_SLOW_QUERIES', '30')
+)
+REQUEST_PROFILING_REPEATED_QUERIES = int(
+    os.getenv('REQUEST_PROFILING_REPEATED_QUERIES', '5')
+)
+
+# Конфигурация текстового поиска PostgreSQL (recipes/search.py).
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'russian')
+
+# Метрики для Prometheus на /api/metrics/ (foodgram/metrics.py). При
+# нескольких воркерах gunicorn METRICS_DIR — общий для них каталог,
+# который очищается при запуске сервиса. Без METRICS_TOKEN метрики
+# доступны только администраторам, с ним — по «Authorization: Bearer».
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False') == 'True'
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Асинхронные GET-эндпоинты (recipes/async_views.py) имеют смысл только
+# под ASGI-сервером; foodgram/asgi.py включает их по умолчанию.
+ASYNC_READ_API = os.getenv('ASYNC_READ_API', 'False') == 'True'
+ROOT_URLCONF = 'foodgram.urls_async' if ASYNC_READ_API else 'foodgram.urls'
 
 TEMPLATES = [
     {
@@ -88,9 +119,47 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', '12345678'),
         'HOST': os.getenv('DB_HOST', 'db'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # Соединение живёт между запросами воркера (секунды, 0 — закрывать
+        # после каждого запроса) и проверяется перед повторным использованием.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': (
+            os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+        ),
+        'OPTIONS': {},
     }
 }
 
+if 'postgresql' in DATABASES['default']['ENGINE']:
+    # Ограничение времени одного SQL-запроса, мс (0 — без ограничения).
+    DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', '0'))
+    if DB_STATEMENT_TIMEOUT:
+        DATABASES['default']['OPTIONS']['options'] = (
+            f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'
+        )
+    # Пул соединений Django 5.1+, нужен psycopg 3 с psycopg[pool];
+    # с пулом постоянные соединения не используются.
+    if os.getenv('DB_POOL', 'False') == 'True':
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', '10')),
+        }
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
+# Время жизни кэша анонимных списков рецептов, 0 — выключен.
+RECIPE_LIST_CACHE_TIMEOUT = int(os.getenv('RECIPE_LIST_CACHE_TIMEOUT', '60'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -141,6 +210,14 @@ DJOSER = {
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+# Автодополнение ингредиентов (?name=) из индекса в памяти процесса.
+INGREDIENT_AUTOCOMPLETE_IN_MEMORY = (
+    os.getenv('INGREDIENT_AUTOCOMPLETE_IN_MEMORY', 'True') == 'True'
+)
+INGREDIENT_AUTOCOMPLETE_TTL = int(
+    os.getenv('INGREDIENT_AUTOCOMPLETE_TTL', '300')
+)
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -168,3 +245,34 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Загрузка картинок: предел размера и миниатюры (recipes/images.py).
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', str(10 * 1024 * 1024))
+)
+# Тело JSON-запроса вмещает картинку в base64 (+1/3) и остальные поля.
+DATA_UPLOAD_MAX_MEMORY_SIZE = IMAGE_UPLOAD_MAX_SIZE * 4 // 3 + 1024 * 1024
+IMAGE_VARIANTS = {
+    'card': (480, 480),
+    'detail': (1280, 1280),
+    'avatar': (160, 160),
+}
+IMAGE_WEBP_QUALITY = int(os.getenv('IMAGE_WEBP_QUALITY', '80'))
+# 0 — миниатюры строятся в потоке запроса после коммита.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '2'))
+
+# PDF списка покупок (recipes/pdf.py): шрифт с кириллицей, каталог
+# кэша, пул сборки, сколько ждать сборку в запросе и сколько файлов
+# держать в кэше.
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+SHOPPING_LIST_PDF_DIR = os.getenv(
+    'SHOPPING_LIST_PDF_DIR', os.path.join(BASE_DIR, 'cache', 'shopping_lists')
+)
+SHOPPING_LIST_PDF_WORKERS = int(os.getenv('SHOPPING_LIST_PDF_WORKERS', '2'))
+SHOPPING_LIST_PDF_WAIT = float(os.getenv('SHOPPING_LIST_PDF_WAIT', '0.2'))
+SHOPPING_LIST_PDF_MAX_FILES = int(
+    os.getenv('SHOPPING_LIST_PDF_MAX_FILES', '1000')
+)
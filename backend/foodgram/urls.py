@@ -8,6 +8,8 @@ from rest_framework.routers import DefaultRouter
 from users.views import UserViewSet
 from recipes.views import IngredientViewSet, TagViewSet, RecipeViewSet
 
+from .views import metrics_view
+
 router = DefaultRouter()
 router.register(r'users', UserViewSet, basename='user')
 router.register(r'ingredients', IngredientViewSet, basename='ingredient')
@@ -20,6 +22,7 @@ urlpatterns = [
     path('api/auth/', include('djoser.urls')),
     path('api/auth/', include('djoser.urls.authtoken')),
     path('api/auth/', include('djoser.urls.jwt')),
+    path('api/metrics/', metrics_view, name='metrics'),
     path('api/', include(router.urls)),
 ]
 
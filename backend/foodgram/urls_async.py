@@ -0,0 +1,9 @@
+"""
+URL-конфигурация для ASGI: горячие GET-эндпоинты обслуживаются
+асинхронными view (recipes.async_views), остальное — как в foodgram.urls.
+"""
+from recipes.async_views import urlpatterns as async_urlpatterns
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = async_urlpatterns + sync_urlpatterns
@@ -0,0 +1,44 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import BasePermission
+
+from recipes import list_cache
+
+from . import metrics
+
+
+class MetricsPermission(BasePermission):
+    """Токен из METRICS_TOKEN для Prometheus или администратор."""
+
+    def has_permission(self, request, view):
+        token = settings.METRICS_TOKEN
+        header = request.headers.get('Authorization', '')
+        keyword, _, key = header.partition(' ')
+        if token and keyword == 'Bearer':
+            return hmac.compare_digest(key.strip(), token)
+        return bool(request.user and request.user.is_staff)
+
+
+def cache_metrics():
+    stats = list_cache.stats()
+    return (
+        ('foodgram_recipe_list_cache_requests_total', 'counter',
+         'Обращения к кэшу анонимного списка рецептов.',
+         [((('result', 'hit'),), stats['hits']),
+          ((('result', 'miss'),), stats['misses'])]),
+        ('foodgram_recipe_list_cache_hit_ratio', 'gauge',
+         'Доля попаданий в кэш анонимного списка рецептов.',
+         [((), stats['hit_ratio'])]),
+    )
+
+
+@api_view(['GET'])
+@permission_classes([MetricsPermission])
+def metrics_view(request):
+    return HttpResponse(
+        metrics.render(cache_metrics()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
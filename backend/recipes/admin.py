@@ -1,6 +1,7 @@
 from django.contrib import admin
 from .models import Ingredient, Recipe, Tag, RecipeIngredient, Favorite
 from .models import ShoppingCart
+from .shopping_list import recipe_ingredients_change
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -19,11 +20,17 @@ class RecipeIngredientInline(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author')
+    list_display = ('name', 'author', 'favorites_count')
     search_fields = ('name', 'author__username')
     list_filter = ('tags',)
     inlines = (RecipeIngredientInline,)
 
+    def save_related(self, request, form, formsets, change):
+        # Инлайн ингредиентов меняет списки покупок тех, у кого рецепт
+        # в корзине.
+        with recipe_ingredients_change(form.instance.pk):
+            super().save_related(request, form, formsets, change)
+
 
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
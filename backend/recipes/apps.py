@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from . import (  # noqa: F401
+            autocomplete,
+            conditional,
+            images,
+            list_cache,
+            search,
+            shopping_list
+        )
@@ -0,0 +1,211 @@
+"""
+Асинхронные версии горячих GET-эндпоинтов для ASGI.
+
+Запросы к БД идут через асинхронный ORM, ответ собирают те же
+сериализаторы DRF по уже загруженным объектам, поэтому формат, ETag
+и кэш анонимных списков совпадают с viewset'ами. Всё, что здесь не
+поддержано — другие методы, не-Token аутентификация, браузерный API,
+параметры вроде ?search=, ?cursor=, ?ordering= — передаётся синхронному
+viewset'у. Подключается через foodgram.urls_async (ASYNC_READ_API).
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import aprefetch_related_objects
+from django.http import HttpResponse
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authtoken.models import Token
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from . import list_cache
+from .autocomplete import ingredient_index
+from .conditional import (
+    aget_version,
+    conditional_response,
+    list_etag,
+    recipe_etag,
+    set_validators
+)
+from .filters import RecipeFilter
+from .models import Ingredient, Recipe, Tag, ingredients_prefetch
+from .serializers import (
+    IngredientSerializer,
+    RecipeReadSerializer,
+    TagSerializer
+)
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+RECIPE_LIST_PARAMS = {
+    'author', 'is_favorited', 'is_in_shopping_cart', 'limit', 'offset', 'tags'
+}
+
+
+def render(data, status=200):
+    return HttpResponse(
+        JSONRenderer().render(data),
+        content_type='application/json',
+        status=status
+    )
+
+
+async def get_user(request):
+    """
+    Пользователь по заголовку «Authorization: Token ...»; None — пусть
+    запрос разберёт DRF (Basic, неверный токен, неактивный пользователь).
+    """
+    header = request.headers.get('Authorization')
+    if not header:
+        return AnonymousUser()
+    keyword, _, key = header.partition(' ')
+    if keyword != 'Token' or not key.strip():
+        return None
+    token = await Token.objects.select_related('user').filter(
+        key=key.strip()).afirst()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+def async_read(sync_view):
+    """
+    GET обрабатывает асинхронный handler; если он вернул None или
+    запрос ему не подходит — синхронный DRF-view в потоке.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def view(request, *args, **kwargs):
+            if (request.method == 'GET'
+                    and 'text/html' not in request.headers.get('Accept', '')):
+                user = await get_user(request)
+                if user is not None:
+                    drf_request = Request(request)
+                    drf_request.user = user
+                    response = await handler(drf_request, *args, **kwargs)
+                    if response is not None:
+                        return response
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+        # Метрики и профилирование подписывают запрос как у viewset'а.
+        view.cls = sync_view.cls
+        view.actions = sync_view.actions
+        return csrf_exempt(view)
+    return decorator
+
+
+async def versioned(request, resource, build):
+    """Асинхронный аналог VersionedListMixin.dispatch_conditional."""
+    version = await aget_version(resource)
+    etag = list_etag(resource, version.version, request)
+    not_modified = conditional_response(request, etag, version.updated_at)
+    if not_modified is not None:
+        return set_validators(not_modified, etag, version.updated_at)
+    response = render(await build(version.version))
+    return set_validators(response, etag, version.updated_at)
+
+
+@async_read(TagViewSet.as_view({'get': 'list'}, basename='tag'))
+async def tag_list(request):
+    async def build(version):
+        tags = [tag async for tag in Tag.objects.all()]
+        return TagSerializer(tags, many=True).data
+    return await versioned(request, 'tags', build)
+
+
+@async_read(IngredientViewSet.as_view({'get': 'list'}, basename='ingredient'))
+async def ingredient_list(request):
+    if set(request.query_params) - {'name', 'limit'}:
+        return None
+    name = request.query_params.get('name')
+    limit = request.query_params.get('limit', '')
+    limit = int(limit) if limit.isdigit() and int(limit) > 0 else None
+
+    async def build(version):
+        if name and settings.INGREDIENT_AUTOCOMPLETE_IN_MEMORY:
+            # Индекс может перестраиваться из БД — в потоке.
+            return await sync_to_async(ingredient_index.search)(
+                name, limit, version=version)
+        queryset = Ingredient.objects.all()
+        if name:
+            queryset = queryset.filter(name__istartswith=name)
+        if limit is not None:
+            queryset = queryset[:limit]
+        ingredients = [ingredient async for ingredient in queryset]
+        return IngredientSerializer(ingredients, many=True).data
+    return await versioned(request, 'ingredients', build)
+
+
+@async_read(RecipeViewSet.as_view(
+    {'get': 'list', 'post': 'create'}, basename='recipe'))
+async def recipe_list(request):
+    if set(request.query_params) - RECIPE_LIST_PARAMS:
+        return None
+    key = None
+    if request.user.is_anonymous and list_cache.is_enabled():
+        key = await sync_to_async(list_cache.make_key)(request)
+        data = await sync_to_async(list_cache.lookup)(key)
+        if data is not None:
+            response = render(data)
+            response['X-Cache'] = 'HIT'
+            return response
+    filterset = RecipeFilter(
+        request.query_params,
+        queryset=Recipe.objects.with_related().with_user_flags(request.user),
+        request=request
+    )
+    # Проверка ?tags= обращается к БД.
+    if not await sync_to_async(filterset.is_valid)():
+        return None
+    queryset = filterset.qs
+    paginator = LimitOffsetPagination()
+    paginator.request = request
+    paginator.limit = paginator.get_limit(request)
+    paginator.offset = paginator.get_offset(request)
+    paginator.count = await queryset.acount()
+    page = [
+        recipe async for recipe in
+        queryset[paginator.offset:paginator.offset + paginator.limit]
+    ]
+    data = paginator.get_paginated_response(RecipeReadSerializer(
+        page, many=True, context={'request': request}
+    ).data).data
+    response = render(data)
+    if key is not None:
+        await sync_to_async(list_cache.store)(key, data)
+        response['X-Cache'] = 'MISS'
+    return response
+
+
+@async_read(RecipeViewSet.as_view({
+    'get': 'retrieve',
+    'put': 'update',
+    'patch': 'partial_update',
+    'delete': 'destroy',
+}, basename='recipe', detail=True))
+async def recipe_detail(request, pk):
+    recipe = await Recipe.objects.with_author().with_user_flags(
+        request.user).filter(pk=pk).afirst()
+    if recipe is None:
+        # 404 в формате DRF.
+        return None
+    version = await aget_version('ingredients')
+    etag = recipe_etag(recipe, version.version)
+    vary = ('Authorization',)
+    not_modified = conditional_response(request, etag)
+    if not_modified is not None:
+        return set_validators(not_modified, etag, vary=vary)
+    await aprefetch_related_objects([recipe], ingredients_prefetch())
+    response = render(RecipeReadSerializer(
+        recipe, context={'request': request}).data)
+    return set_validators(response, etag, vary=vary)
+
+
+urlpatterns = [
+    path('api/tags/', tag_list),
+    path('api/ingredients/', ingredient_list),
+    path('api/recipes/', recipe_list),
+    path('api/recipes/<int:pk>/', recipe_detail),
+]
@@ -0,0 +1,79 @@
+"""
+Автодополнение ингредиентов из памяти процесса.
+
+Названия хранятся отсортированным списком в casefold-виде, префикс ищется
+двумя bisect. Индекс сбрасывается сигналами Ingredient в текущем процессе
+и перестраивается, когда версия ресурса ingredients (ResourceVersion)
+отличается от той, с которой он построен, — так подхватываются изменения
+из других воркеров. Без версии действует INGREDIENT_AUTOCOMPLETE_TTL.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Ingredient
+
+# Больше любого символа, который встретится в названии.
+_MAX_CHAR = '\U0010ffff'
+
+
+class IngredientIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+        self._rows = None
+        self._built_at = 0.0
+        self._version = None
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = self._rows = None
+
+    def _is_stale(self, version):
+        if self._keys is None:
+            return True
+        if version is not None:
+            return version != self._version
+        ttl = settings.INGREDIENT_AUTOCOMPLETE_TTL
+        return time.monotonic() - self._built_at > ttl
+
+    def _load(self, version=None):
+        with self._lock:
+            if self._is_stale(version):
+                entries = sorted(
+                    (name.casefold(), pk, name, unit)
+                    for pk, name, unit in Ingredient.objects.order_by()
+                    .values_list('id', 'name', 'measurement_unit')
+                    .iterator()
+                )
+                self._keys = [entry[0] for entry in entries]
+                self._rows = [
+                    {'id': pk, 'name': name, 'measurement_unit': unit}
+                    for _, pk, name, unit in entries
+                ]
+                self._built_at = time.monotonic()
+                self._version = version
+            return self._keys, self._rows
+
+    def search(self, prefix, limit=None, version=None):
+        keys, rows = self._load(version)
+        prefix = prefix.casefold()
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + _MAX_CHAR, lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return rows[start:end]
+
+
+ingredient_index = IngredientIndex()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
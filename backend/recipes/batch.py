@@ -0,0 +1,105 @@
+"""
+Пакетное добавление рецептов в избранное или корзину и удаление.
+
+Один запрос узнаёт, какие из переданных рецептов существуют. Добавление
+— один INSERT ... ON CONFLICT DO NOTHING, удаление — один DELETE; оба
+возвращают (RETURNING) рецепты, строки которых действительно вставлены
+или удалены. Счётчики и список покупок меняются одним запросом только
+для этих рецептов, поэтому одновременные запросы с теми же рецептами их
+не сбивают.
+"""
+from django.db import connection, transaction
+
+from . import counters, shopping_list
+from .models import Favorite, Recipe, ShoppingCart
+
+CREATED = 'created'
+EXISTS = 'exists'
+DELETED = 'deleted'
+MISSING = 'missing'
+NOT_FOUND = 'not_found'
+
+COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'carts_count',
+}
+
+INSERT = '''
+    INSERT INTO {table} (user_id, recipe_id) VALUES {values}
+    ON CONFLICT (user_id, recipe_id) DO NOTHING
+    RETURNING recipe_id
+'''
+DELETE = '''
+    DELETE FROM {table} WHERE user_id = %s AND recipe_id IN ({recipes})
+    RETURNING recipe_id
+'''
+
+
+def _lookup(recipe_ids):
+    """Множество id существующих рецептов из recipe_ids."""
+    return set(
+        Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', flat=True)
+    )
+
+
+def _returning(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {pk for pk, in cursor.fetchall()}
+
+
+def _results(recipe_ids, found, changed, if_changed, if_unchanged):
+    return [
+        {
+            'id': pk,
+            'status': (
+                NOT_FOUND if pk not in found
+                else if_changed if pk in changed else if_unchanged
+            ),
+        }
+        for pk in recipe_ids
+    ]
+
+
+def add(model, user, recipe_ids):
+    """
+    Добавляет рецепты в список model (Favorite или ShoppingCart)
+    пользователя user. Статус каждого id: created, exists или not_found.
+    """
+    found = _lookup(recipe_ids)
+    created = set()
+    if found:
+        with transaction.atomic():
+            created = _returning(
+                INSERT.format(
+                    table=model._meta.db_table,
+                    values=', '.join(['(%s, %s)'] * len(found))
+                ),
+                [param for pk in found for param in (user.pk, pk)]
+            )
+            counters.change_recipe_counters(created, COUNTERS[model], 1)
+            if model is ShoppingCart:
+                shopping_list.add_recipes(created, user.pk)
+    return _results(recipe_ids, found, created, CREATED, EXISTS)
+
+
+def remove(model, user, recipe_ids):
+    """
+    Удаляет рецепты из списка model пользователя user. Статус каждого
+    id: deleted, missing (рецепта не было в списке) или not_found.
+    """
+    found = _lookup(recipe_ids)
+    deleted = set()
+    if found:
+        with transaction.atomic():
+            deleted = _returning(
+                DELETE.format(
+                    table=model._meta.db_table,
+                    recipes=', '.join(['%s'] * len(found))
+                ),
+                [user.pk, *found]
+            )
+            counters.change_recipe_counters(deleted, COUNTERS[model], -1)
+            if model is ShoppingCart:
+                shopping_list.remove_recipes(deleted, user.pk)
+    return _results(recipe_ids, found, deleted, DELETED, MISSING)
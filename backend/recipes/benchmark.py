@@ -0,0 +1,380 @@
+"""
+Синтетический набор данных и замер API.
+
+Для каждого эндпоинта считается число SQL-запросов и время ответа.
+Используется тестами (верхние границы по запросам и времени) и командой
+``benchmark_api`` (таблица для сравнения веток).
+"""
+import base64
+import json
+import random
+import statistics
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from users.models import Profile, Subscription
+from . import counters, list_cache, search, shopping_list
+from .autocomplete import ingredient_index
+from .conditional import bump_version
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag
+)
+
+User = get_user_model()
+
+# Картинка 1x1 для создания рецепта и аватара.
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJ'
+    'AAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+)
+BENCH_IMAGE = 'recipes/images/bench.png'
+
+DEFAULT_SIZES = {
+    'users': 2000,
+    'recipes': 5000,
+    'tags': 10,
+    'ingredients_per_recipe': 8,
+    'favorites_per_user': 5,
+    'carts_per_user': 3,
+    'subscriptions_per_user': 5,
+    # Активный пользователь, от имени которого идут запросы.
+    'bench_favorites': 50,
+    'bench_cart': 20,
+    'bench_subscriptions': 50,
+}
+
+Endpoint = namedtuple(
+    'Endpoint',
+    'name group method path status max_queries data anonymous',
+    defaults=(None, False)
+)
+Result = namedtuple('Result', 'endpoint status queries timings sql')
+
+
+def _recipe_payload(ctx):
+    return {
+        'ingredients': [
+            {'id': pk, 'amount': 10} for pk in ctx['ingredient_ids']
+        ],
+        'tags': ctx['tag_ids'],
+        'image': IMAGE,
+        'name': 'Бенчмарк',
+        'text': 'Описание',
+        'cooking_time': 15,
+    }
+
+
+# Бюджеты включают SAVEPOINT/RELEASE вложенных atomic: замер идёт
+# внутри транзакции, в работе это обычные BEGIN/COMMIT.
+ENDPOINTS = [
+    Endpoint('RecipeViewSet.list', 'recipes', 'get',
+             '/api/recipes/?limit=6', 200, 3),
+    Endpoint('RecipeViewSet.list (limit=50)', 'recipes', 'get',
+             '/api/recipes/?limit=50', 200, 3),
+    Endpoint('RecipeViewSet.list (cursor)', 'recipes', 'get',
+             '/api/recipes/?cursor=&limit=6', 200, 2),
+    Endpoint('RecipeViewSet.list (cursor, tags)', 'recipes', 'get',
+             '/api/recipes/?cursor=&limit=6&tags={tag_slug}', 200, 3),
+    Endpoint('RecipeViewSet.list (anonymous)', 'recipes', 'get',
+             '/api/recipes/?limit=6', 200, 3, anonymous=True),
+    Endpoint('RecipeViewSet.list (ordering)', 'recipes', 'get',
+             '/api/recipes/?ordering=-favorites_count', 200, 3),
+    Endpoint('RecipeViewSet.list (author)', 'recipes', 'get',
+             '/api/recipes/?author={author}', 200, 4),
+    Endpoint('RecipeViewSet.list (tags)', 'recipes', 'get',
+             '/api/recipes/?tags={tag_slug}', 200, 4),
+    Endpoint('RecipeViewSet.list (is_favorited)', 'recipes', 'get',
+             '/api/recipes/?is_favorited=1', 200, 3),
+    Endpoint('RecipeViewSet.list (is_in_shopping_cart)', 'recipes', 'get',
+             '/api/recipes/?is_in_shopping_cart=1', 200, 3),
+    Endpoint('RecipeViewSet.list (search)', 'recipes', 'get',
+             '/api/recipes/?search={recipe_name}', 200, 3),
+    Endpoint('RecipeViewSet.feed', 'recipes', 'get',
+             '/api/recipes/feed/?limit=6', 200, 2),
+    Endpoint('RecipeViewSet.feed (limit=50)', 'recipes', 'get',
+             '/api/recipes/feed/?limit=50', 200, 2),
+    Endpoint('RecipeViewSet.retrieve', 'recipes', 'get',
+             '/api/recipes/{recipe}/', 200, 3),
+    Endpoint('RecipeViewSet.create', 'recipes', 'post',
+             '/api/recipes/', 201, 13, _recipe_payload),
+    Endpoint('RecipeViewSet.partial_update', 'recipes', 'patch',
+             '/api/recipes/{own_recipe}/', 200, 16, _recipe_payload),
+    Endpoint('RecipeViewSet.destroy', 'recipes', 'delete',
+             '/api/recipes/{own_recipe}/', 204, 13),
+    Endpoint('RecipeViewSet.favorite', 'recipes', 'post',
+             '/api/recipes/{recipe}/favorite/', 201, 5),
+    Endpoint('RecipeViewSet.delete_favorite', 'recipes', 'delete',
+             '/api/recipes/{favorited}/favorite/', 204, 4),
+    Endpoint('RecipeViewSet.shopping_cart', 'recipes', 'post',
+             '/api/recipes/{recipe}/shopping_cart/', 201, 6),
+    Endpoint('RecipeViewSet.delete_shopping_cart', 'recipes', 'delete',
+             '/api/recipes/{in_cart}/shopping_cart/', 204, 5),
+    Endpoint('RecipeViewSet.favorite_batch', 'recipes', 'post',
+             '/api/recipes/favorite/', 200, 5,
+             lambda ctx: {'recipes': ctx['batch_recipes']}),
+    Endpoint('RecipeViewSet.delete_favorite_batch', 'recipes', 'delete',
+             '/api/recipes/favorite/', 200, 5,
+             lambda ctx: {'recipes': ctx['favorited_batch']}),
+    Endpoint('RecipeViewSet.shopping_cart_batch', 'recipes', 'post',
+             '/api/recipes/shopping_cart/', 200, 6,
+             lambda ctx: {'recipes': ctx['batch_recipes']}),
+    Endpoint('RecipeViewSet.delete_shopping_cart_batch', 'recipes',
+             'delete', '/api/recipes/shopping_cart/', 200, 6,
+             lambda ctx: {'recipes': ctx['in_cart_batch']}),
+    Endpoint('RecipeViewSet.shopping_list', 'recipes', 'get',
+             '/api/recipes/shopping_list/', 200, 1),
+    Endpoint('RecipeViewSet.download_shopping_cart', 'recipes', 'get',
+             '/api/recipes/download_shopping_cart/', 200, 1),
+    Endpoint('RecipeViewSet.download_shopping_cart (csv)', 'recipes', 'get',
+             '/api/recipes/download_shopping_cart/?format=csv', 200, 1),
+    Endpoint('RecipeViewSet.download_shopping_cart (json)', 'recipes',
+             'get', '/api/recipes/download_shopping_cart/?format=json',
+             200, 1),
+    Endpoint('RecipeViewSet.get_link', 'recipes', 'get',
+             '/api/recipes/{recipe}/get-link/', 200, 1),
+    Endpoint('IngredientViewSet.list', 'ingredients', 'get',
+             '/api/ingredients/?name={ingredient_prefix}', 200, 2),
+    Endpoint('IngredientViewSet.list (limit)', 'ingredients', 'get',
+             '/api/ingredients/?name={ingredient_prefix}&limit=10', 200, 2),
+    Endpoint('IngredientViewSet.list (all)', 'ingredients', 'get',
+             '/api/ingredients/', 200, 2),
+    Endpoint('IngredientViewSet.retrieve', 'ingredients', 'get',
+             '/api/ingredients/{ingredient}/', 200, 2),
+    Endpoint('TagViewSet.list', 'tags', 'get', '/api/tags/', 200, 2),
+    Endpoint('TagViewSet.retrieve', 'tags', 'get',
+             '/api/tags/{tag}/', 200, 2),
+    Endpoint('UserViewSet.list', 'users', 'get',
+             '/api/users/?limit=6', 200, 2),
+    Endpoint('UserViewSet.list (anonymous)', 'users', 'get',
+             '/api/users/?limit=6', 200, 2, anonymous=True),
+    Endpoint('UserViewSet.retrieve', 'users', 'get',
+             '/api/users/{author}/', 200, 1),
+    Endpoint('UserViewSet.create', 'users', 'post', '/api/users/', 201, 4,
+             lambda ctx: {
+                 'email': 'bench@example.org',
+                 'username': 'bench_new',
+                 'first_name': 'Bench',
+                 'last_name': 'Mark',
+                 'password': 'Bench-Pa55word',
+             }, anonymous=True),
+    Endpoint('UserViewSet.me', 'users', 'get', '/api/users/me/', 200, 2),
+    Endpoint('UserViewSet.subscriptions', 'users', 'get',
+             '/api/users/subscriptions/?limit=6&recipes_limit=3',
+             200, 3),
+    Endpoint('UserViewSet.subscribe', 'users', 'post',
+             '/api/users/{author}/subscribe/', 201, 7),
+    Endpoint('UserViewSet.unsubscribe', 'users', 'delete',
+             '/api/users/{followed}/subscribe/', 204, 4),
+    Endpoint('UserViewSet.avatar', 'users', 'get',
+             '/api/users/{author}/avatar/', 200, 2),
+    Endpoint('UserViewSet.user_avatar (GET)', 'users', 'get',
+             '/api/users/me/avatar/', 200, 1),
+    Endpoint('UserViewSet.user_avatar (PUT)', 'users', 'put',
+             '/api/users/me/avatar/', 200, 2,
+             lambda ctx: {'avatar': IMAGE}),
+    Endpoint('UserViewSet.user_avatar (DELETE)', 'users', 'delete',
+             '/api/users/me/avatar/', 204, 1),
+    Endpoint('UserViewSet.set_password', 'users', 'post',
+             '/api/users/set_password/', 204, 3,
+             lambda ctx: {
+                 'current_password': ctx['password'],
+                 'new_password': 'Another-Pa55word',
+             }),
+]
+
+
+def load_ingredients():
+    path = settings.BASE_DIR / 'data' / 'ingredients.json'
+    with open(path, encoding='utf-8') as jsonfile:
+        return [
+            Ingredient(
+                name=item['name'].strip(),
+                measurement_unit=item['measurement_unit'].strip()
+            )
+            for item in json.load(jsonfile)
+        ]
+
+
+def seed(sizes=None, password='Bench-Pa55word', rng_seed=0, *, storage):
+    """
+    Заполняет базу синтетическими данными через bulk_create и возвращает
+    контекст с id объектов для подстановки в пути ENDPOINTS.
+
+    storage — временное хранилище для общей картинки рецептов; вызывающий
+    подменяет MEDIA_ROOT на его каталог и удаляет его после замера.
+    """
+    sizes = {**DEFAULT_SIZES, **(sizes or {})}
+    rng = random.Random(rng_seed)
+
+    hashed = make_password(password)
+    User.objects.bulk_create(
+        User(
+            username=f'bench_{i}',
+            email=f'bench_{i}@example.org',
+            first_name='Bench',
+            last_name=str(i),
+            password=hashed,
+        )
+        for i in range(sizes['users'])
+    )
+    user_ids = list(
+        User.objects.filter(username__startswith='bench_')
+        .order_by('id').values_list('id', flat=True)
+    )
+    # bulk_create не шлёт post_save, профили создаём сами.
+    Profile.objects.bulk_create(Profile(user_id=pk) for pk in user_ids)
+
+    Ingredient.objects.bulk_create(load_ingredients(), ignore_conflicts=True)
+    ingredient_index.invalidate()
+    bump_version('ingredients')
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+
+    Tag.objects.bulk_create(
+        Tag(name=f'Тег {i}', color=f'#{i:06x}', slug=f'tag-{i}')
+        for i in range(sizes['tags'])
+    )
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    bump_version('tags')
+
+    # Общая картинка рецептов — из неё строятся миниатюры при сохранении.
+    if not storage.exists(BENCH_IMAGE):
+        storage.save(BENCH_IMAGE, ContentFile(
+            base64.b64decode(IMAGE.split(',', 1)[1])))
+    bench_id, authors = user_ids[0], user_ids[1:]
+    Recipe.objects.bulk_create(
+        Recipe(
+            author_id=bench_id if i % 100 == 0 else rng.choice(authors),
+            name=f'Рецепт {i}',
+            image=BENCH_IMAGE,
+            text='Описание рецепта',
+            cooking_time=rng.randint(1, 180),
+        )
+        for i in range(sizes['recipes'])
+    )
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe_id=recipe, ingredient_id=ingredient,
+                         amount=rng.randint(1, 500))
+        for recipe in recipe_ids
+        for ingredient in rng.sample(
+            ingredient_ids, sizes['ingredients_per_recipe'])
+    )
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+        for recipe in recipe_ids
+        for tag in rng.sample(tag_ids, 2)
+    )
+
+    own = set(
+        Recipe.objects.filter(author_id=bench_id)
+        .values_list('id', flat=True)
+    )
+    others = [pk for pk in recipe_ids if pk not in own]
+    bench_favorites = rng.sample(others, sizes['bench_favorites'])
+    bench_cart = rng.sample(others, sizes['bench_cart'])
+    bench_follows = rng.sample(authors, sizes['bench_subscriptions'])
+
+    def pairs(per_user, population, bench_items):
+        yield from ((bench_id, item) for item in bench_items)
+        for user in authors:
+            for item in rng.sample(population, per_user):
+                if item != user:
+                    yield user, item
+
+    Favorite.objects.bulk_create(
+        Favorite(user_id=user, recipe_id=recipe)
+        for user, recipe in pairs(
+            sizes['favorites_per_user'], recipe_ids, bench_favorites)
+    )
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user_id=user, recipe_id=recipe)
+        for user, recipe in pairs(
+            sizes['carts_per_user'], recipe_ids, bench_cart)
+    )
+    Subscription.objects.bulk_create(
+        Subscription(user_id=user, author_id=author)
+        for user, author in pairs(
+            sizes['subscriptions_per_user'], user_ids, bench_follows)
+    )
+
+    # bulk_create не шлёт сигналы: счётчики, поисковый индекс, списки
+    # покупок и кэш списков рецептов выравниваем сами.
+    counters.recount()
+    search.reindex()
+    shopping_list.rebuild()
+    list_cache.invalidate_all()
+
+    untouched = sorted(set(others) - set(bench_favorites) - set(bench_cart))
+    recipe = Recipe.objects.get(pk=untouched[0])
+    ingredient = Ingredient.objects.get(pk=ingredient_ids[0])
+    return {
+        'user': User.objects.get(pk=bench_id),
+        'password': password,
+        'recipe': recipe.pk,
+        'recipe_name': recipe.name,
+        'own_recipe': min(own),
+        'favorited': bench_favorites[0],
+        'in_cart': bench_cart[0],
+        'batch_recipes': untouched[1:11],
+        'favorited_batch': bench_favorites[:10],
+        'in_cart_batch': bench_cart[:10],
+        'author': next(pk for pk in authors if pk not in bench_follows),
+        'followed': bench_follows[0],
+        'ingredient': ingredient.pk,
+        'ingredient_prefix': ingredient.name[:2],
+        'ingredient_ids': ingredient_ids[:5],
+        'tag': tag_ids[0],
+        'tag_slug': Tag.objects.get(pk=tag_ids[0]).slug,
+        'tag_ids': tag_ids[:2],
+    }
+
+
+def measure(endpoint, ctx, repeat=1):
+    """
+    Выполняет запрос repeat раз, каждый — в откатываемой точке сохранения,
+    чтобы пишущие эндпоинты видели одно и то же состояние базы.
+    """
+    client = APIClient()
+    path = endpoint.path.format(**ctx)
+    kwargs = {}
+    if endpoint.data is not None:
+        kwargs = {'data': endpoint.data(ctx), 'format': 'json'}
+    timings = []
+    for _ in range(repeat):
+        if not endpoint.anonymous:
+            # Свежий объект на каждый запрос: откат не затрагивает
+            # состояние в памяти (пароль, закешированный профиль).
+            client.force_authenticate(User.objects.get(pk=ctx['user'].pk))
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = getattr(client, endpoint.method)(path, **kwargs)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append(time.perf_counter() - start)
+            transaction.set_rollback(True)
+    return Result(
+        endpoint,
+        response.status_code,
+        len(queries),
+        timings,
+        [query['sql'] for query in queries.captured_queries]
+    )
+
+
+def median_ms(result):
+    return statistics.median(result.timings) * 1000
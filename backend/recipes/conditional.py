@@ -0,0 +1,132 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для редко меняющихся данных.
+
+Версия ресурса хранится в ResourceVersion и увеличивается сигналами,
+поэтому все воркеры видят одну и ту же версию. Если клиент прислал
+совпадающий If-None-Match, отвечаем 304, ничего не сериализуя.
+"""
+import hashlib
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .models import Ingredient, ResourceVersion, Tag
+
+RESOURCES = {
+    Tag: 'tags',
+    Ingredient: 'ingredients',
+}
+
+
+def bump_version(resource):
+    updated = ResourceVersion.objects.filter(resource=resource).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    )
+    if not updated:
+        ResourceVersion.objects.get_or_create(
+            resource=resource, defaults={'version': 1}
+        )
+
+
+def get_version(resource):
+    version, _ = ResourceVersion.objects.get_or_create(resource=resource)
+    return version
+
+
+async def aget_version(resource):
+    version, _ = await ResourceVersion.objects.aget_or_create(
+        resource=resource)
+    return version
+
+
+def make_etag(*parts):
+    digest = hashlib.md5(
+        '|'.join(map(str, parts)).encode(), usedforsecurity=False
+    ).hexdigest()
+    return quote_etag(digest)
+
+
+def list_etag(resource, version, request):
+    """Версия ресурса + полный путь запроса (фильтры меняют ответ)."""
+    return make_etag(resource, version, request.get_full_path())
+
+
+def recipe_etag(recipe, ingredients_version):
+    """
+    ETag рецепта из строки с аннотациями пользователя (with_user_flags),
+    автора с профилем и версии ингредиентов.
+    """
+    author = recipe.author
+    profile = getattr(author, 'profile', None)
+    avatar = getattr(profile, 'avatar', None)
+    return make_etag(
+        'recipe', recipe.pk, recipe.updated_at.isoformat(),
+        recipe.image_variants,
+        recipe.is_favorited, recipe.is_in_shopping_cart,
+        recipe.author_is_subscribed, author.pk, author.email,
+        author.username, author.first_name, author.last_name,
+        avatar.name if avatar else '',
+        profile.avatar_variants if profile else {},
+        ingredients_version,
+    )
+
+
+def conditional_response(request, etag, last_modified=None):
+    """304, если If-None-Match/If-Modified-Since совпали, иначе None."""
+    timestamp = last_modified.timestamp() if last_modified else None
+    return get_conditional_response(
+        request, etag=etag, last_modified=timestamp
+    )
+
+
+def set_validators(response, etag, last_modified=None, vary=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    if vary:
+        patch_vary_headers(response, vary)
+    return response
+
+
+class VersionedListMixin:
+    """
+    ETag для list/retrieve справочника (см. list_etag).
+    """
+
+    version_resource = None
+
+    def dispatch_conditional(self, request, handler, *args, **kwargs):
+        version = get_version(self.version_resource)
+        self.resource_version = version.version
+        etag = list_etag(self.version_resource, version.version, request)
+        not_modified = conditional_response(
+            request, etag, version.updated_at)
+        if not_modified is not None:
+            return set_validators(not_modified, etag, version.updated_at)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_validators(response, etag, version.updated_at)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.dispatch_conditional(
+            request, self.list_response, *args, **kwargs)
+
+    def list_response(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.dispatch_conditional(
+            request, super().retrieve, *args, **kwargs)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_resource_version(sender, **kwargs):
+    bump_version(RESOURCES[sender])
@@ -0,0 +1,83 @@
+"""
+Денормализованные счётчики: Recipe.favorites_count / carts_count
+и Profile.recipes_count / subscribers_count.
+
+Счётчики меняются UPDATE ... SET x = x ± n в тех же действиях API, где
+создаётся или удаляется связь, поэтому параллельные запросы не теряют
+инкременты. Каскадные удаления (удаление пользователя вместе с его
+избранным и подписками), bulk-операции и правки в админке счётчики
+не трогают — их выравнивает команда recount_counters.
+"""
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Profile, Subscription
+from .models import Favorite, Recipe, ShoppingCart
+
+RECIPE_COUNTERS = {
+    'favorites_count': (Favorite, 'recipe'),
+    'carts_count': (ShoppingCart, 'recipe'),
+}
+PROFILE_COUNTERS = {
+    'recipes_count': (Recipe, 'author'),
+    'subscribers_count': (Subscription, 'author'),
+}
+
+
+def count_of(model, field, outer='pk'):
+    """Подзапрос COUNT(*) строк model, у которых field = внешней строке."""
+    rows = (
+        model.objects
+        .filter(**{field: OuterRef(outer)})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(rows), 0)
+
+
+def _change(queryset, field, delta):
+    if delta:
+        queryset.update(**{field: F(field) + delta})
+
+
+def change_recipe_counter(recipe_id, field, delta):
+    _change(Recipe.objects.filter(pk=recipe_id), field, delta)
+
+
+def change_recipe_counters(recipe_ids, field, delta):
+    """Меняет счётчик сразу у нескольких рецептов одним UPDATE."""
+    if recipe_ids:
+        _change(Recipe.objects.filter(pk__in=recipe_ids), field, delta)
+
+
+def change_profile_counter(user_id, field, delta):
+    _change(Profile.objects.filter(user_id=user_id), field, delta)
+
+
+def _recount(queryset, counters, outer, dry_run):
+    actual = {
+        field: count_of(model, related, outer)
+        for field, (model, related) in counters.items()
+    }
+    wrong = Q()
+    for field in counters:
+        wrong |= ~Q(**{field: actual[field]})
+    stale = queryset.filter(wrong)
+    if dry_run:
+        return stale.count()
+    return stale.update(**actual)
+
+
+def recount(dry_run=False):
+    """
+    Пересчитывает все счётчики одним UPDATE на таблицу, трогая только
+    разошедшиеся строки. Возвращает число таких строк по моделям.
+    """
+    return {
+        'recipes': _recount(
+            Recipe.objects.all(), RECIPE_COUNTERS, 'pk', dry_run),
+        'profiles': _recount(
+            Profile.objects.all(), PROFILE_COUNTERS, 'user_id', dry_run),
+    }
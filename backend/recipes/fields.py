@@ -1,19 +1,155 @@
 import base64
+import binascii
+import re
 import uuid
-from django.core.files.base import ContentFile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import (
+    InMemoryUploadedFile,
+    TemporaryUploadedFile
+)
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+from foodgram import metrics
+
+
+DATA_URI = re.compile(r'data:image/(?P<ext>[a-z]+);base64,')
+IMAGE_TYPES = ('png', 'jpeg', 'jpg', 'gif', 'webp')
+# Длина куска base64 кратна 4, чтобы куски декодировались независимо.
+CHUNK_SIZE = 64 * 1024
+
+
+def decode_base64(data, start, fileobj, chunk_size=CHUNK_SIZE):
+    """
+    Декодирует data[start:] в fileobj кусками, пропуская переводы строк:
+    в памяти одновременно только исходная строка и один кусок.
+    """
+    tail = ''
+    for offset in range(start, len(data), chunk_size):
+        chunk = data[offset:offset + chunk_size]
+        chunk = tail + chunk.replace('\n', '').replace('\r', '')
+        cut = len(chunk) - len(chunk) % 4
+        if '=' in chunk[:cut] and offset + chunk_size < len(data):
+            raise binascii.Error('Padding в середине данных.')
+        fileobj.write(base64.b64decode(chunk[:cut], validate=True))
+        tail = chunk[cut:]
+    if tail:
+        raise binascii.Error('Некорректная длина base64.')
+
+
+def open_upload(name, content_type, size):
+    """Маленькие файлы — в памяти, большие — во временном файле на диске."""
+    if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+        return TemporaryUploadedFile(name, content_type, size, None)
+    return InMemoryUploadedFile(
+        BytesIO(), None, name, content_type, size, None)
 
 
 class Base64ImageField(serializers.ImageField):
     """
-    Кастомное поле для декодирования base64-картинок
+    Кастомное поле для декодирования base64-картинок.
+    Заголовок data URI и размер проверяются до декодирования,
+    само декодирование идёт кусками (см. decode_base64).
     """
+    default_error_messages = {
+        'too_large': 'Размер картинки больше {max_size} байт.',
+        'invalid_data_uri': (
+            'Ожидается data:image/<тип>;base64,... '
+            'с типом из: {types}.'
+        ),
+    }
 
     def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            imgstr = imgstr.replace('\n', '').replace('\r', '')
-            name = f"{uuid.uuid4()}.{ext}"
-            data = ContentFile(base64.b64decode(imgstr), name=name)
+        if isinstance(data, str) and data.startswith('data:'):
+            data = self.decode(data)
         return super().to_internal_value(data)
+
+    def decode(self, data):
+        header = DATA_URI.match(data, 0, 64)
+        if header is None or header['ext'] not in IMAGE_TYPES:
+            self.fail('invalid_data_uri', types=', '.join(IMAGE_TYPES))
+        start = header.end()
+        length = (
+            len(data) - start
+            - data.count('\n', start) - data.count('\r', start)
+        )
+        size = length * 3 // 4 - data.count('=', len(data) - 2)
+        max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        if size > max_size:
+            self.fail('too_large', max_size=max_size)
+        upload = open_upload(
+            f"{uuid.uuid4()}.{header['ext']}",
+            f"image/{header['ext']}",
+            size
+        )
+        try:
+            decode_base64(data, start, upload.file)
+        except binascii.Error:
+            upload.close()
+            self.fail('invalid_image')
+        upload.file.seek(0)
+        metrics.observe(
+            'foodgram_image_upload_bytes', size, type=header['ext'])
+        return upload
+
+
+def resolve_pks(queryset, pks, message):
+    """
+    Находит объекты по списку id одним запросом in_bulk.
+    Все отсутствующие id попадают в одну ошибку валидации.
+    """
+    found = queryset.in_bulk(set(pks))
+    missing = sorted({pk for pk in pks if pk not in found})
+    if missing:
+        raise serializers.ValidationError(
+            message.format(ids=', '.join(map(str, missing)))
+        )
+    return [found[pk] for pk in pks]
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """
+    Список id, который проверяется одним запросом, а не запросом
+    на каждый элемент, как в ManyRelatedField.
+    """
+
+    def __init__(self, missing_message, **kwargs):
+        self.missing_message = missing_message
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        pks = []
+        for item in data:
+            if isinstance(item, bool):
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(item).__name__)
+            try:
+                pks.append(int(item))
+            except (TypeError, ValueError):
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(item).__name__)
+        return resolve_pks(
+            self.child_relation.get_queryset(), pks, self.missing_message
+        )
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """При many=True проверяет весь список id одним запросом."""
+
+    default_missing_message = 'Несуществующие id: {ids}.'
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        missing_message = kwargs.pop(
+            'missing_message', cls.default_missing_message)
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(missing_message, **list_kwargs)
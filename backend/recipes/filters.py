@@ -1,19 +1,28 @@
 # recipes/filters.py
 
 import django_filters
+from django_filters.widgets import BooleanWidget
+from rest_framework.filters import OrderingFilter, SearchFilter
 
-from .models import Recipe
+from . import search
+from .models import Recipe, Tag
 
 
 class RecipeFilter(django_filters.FilterSet):
     is_favorited = django_filters.BooleanFilter(
-        method='filter_is_favorited'
+        method='filter_is_favorited',
+        widget=BooleanWidget
     )
     is_in_shopping_cart = django_filters.BooleanFilter(
-        method='filter_in_shopping_cart'
+        method='filter_in_shopping_cart',
+        widget=BooleanWidget
     )
-    tags = django_filters.AllValuesMultipleFilter(
-        field_name='tags__slug'
+    # Слаги проверяются по Tag только когда параметр передан,
+    # без DISTINCT-запроса по всем рецептам ради choices.
+    tags = django_filters.ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all()
     )
 
     class Meta:
@@ -29,16 +38,34 @@ class RecipeFilter(django_filters.FilterSet):
         user = self.request.user
         if not user.is_authenticated:
             return queryset
-        if value:
-            return queryset.filter(favorited_by__user=user)
-        # при false — исключаем
-        return queryset.exclude(favorited_by__user=user)
+        # is_favorited аннотирован в RecipeViewSet.get_queryset
+        return queryset.filter(is_favorited=value)
 
     def filter_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if not user.is_authenticated:
             return queryset
-        if value:
-            return queryset.filter(in_shopping_carts__user=user)
-        # при false — исключаем
-        return queryset.exclude(in_shopping_carts__user=user)
+        return queryset.filter(is_in_shopping_cart=value)
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """
+    ?ordering=-favorites_count — по денормализованным счётчикам;
+    при равенстве порядок -id, чтобы страницы не пересекались.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and not {'id', '-id'} & set(ordering):
+            ordering = [*ordering, '-id']
+        return ordering
+
+
+class RecipeSearchFilter(SearchFilter):
+    """
+    ?search= — полнотекстовый поиск по названию, ингредиентам и
+    описанию (см. recipes/search.py) с сортировкой по релевантности.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        return search.search(queryset, self.get_search_terms(request))
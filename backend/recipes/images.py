@@ -0,0 +1,150 @@
+"""
+Миниатюры загруженных картинок рецептов и аватаров.
+
+После коммита транзакции с новой картинкой задача уходит в пул потоков:
+Pillow уменьшает оригинал до размеров из IMAGE_VARIANTS и сохраняет
+WebP рядом с ним, в подкаталог variants/. Имена файлов пишутся в
+image_variants / avatar_variants вместе с именем исходника, поэтому
+сериализаторы отдают миниатюры только текущей картинки, а пока их нет —
+оригинал. Миниатюры заменённой или удалённой картинки удаляются той же
+задачей. При IMAGE_WORKERS=0 обработка идёт в потоке запроса.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps
+
+from users.models import Profile
+from . import list_cache
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# Модель: (поле картинки, поле миниатюр, варианты, поле автора).
+SPECS = {
+    Recipe: ('image', 'image_variants', ('card', 'detail'), 'author_id'),
+    Profile: ('avatar', 'avatar_variants', ('avatar',), 'user_id'),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='images'
+            )
+    return _executor
+
+
+def variant_name(source, variant):
+    root, _ = os.path.splitext(source)
+    directory, base = os.path.split(root)
+    return os.path.join(directory, 'variants', f'{base}.{variant}.webp')
+
+
+def make_variants(storage, source, variants):
+    """Сохраняет WebP-миниатюры и возвращает {вариант: имя файла}."""
+    names = {'source': source}
+    with storage.open(source, 'rb') as fileobj, Image.open(fileobj) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        for variant in variants:
+            thumbnail = image.copy()
+            thumbnail.thumbnail(settings.IMAGE_VARIANTS[variant])
+            buffer = BytesIO()
+            thumbnail.save(
+                buffer, 'WEBP', quality=settings.IMAGE_WEBP_QUALITY)
+            name = variant_name(source, variant)
+            storage.delete(name)
+            names[variant] = storage.save(
+                name, ContentFile(buffer.getvalue()))
+    return names
+
+
+def process(model, pk, source, author_id, stale=()):
+    field, variants_field, variants, _ = SPECS[model]
+    storage = model._meta.get_field(field).storage
+    for name in stale:
+        storage.delete(name)
+    if not source:
+        model.objects.filter(pk=pk, **{field: ''}).update(
+            **{variants_field: {}}
+        )
+        return
+    names = make_variants(storage, source, variants)
+    # Картинку могли заменить, пока строились миниатюры.
+    updated = model.objects.filter(pk=pk, **{field: source}).update(
+        **{variants_field: names}
+    )
+    if updated:
+        list_cache.invalidate_author(author_id)
+    else:
+        for variant in variants:
+            storage.delete(names[variant])
+
+
+def _run(model, pk, source, author_id, stale):
+    try:
+        process(model, pk, source, author_id, stale)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры %s', source)
+
+
+def _run_in_worker(*args):
+    try:
+        _run(*args)
+    finally:
+        connections.close_all()
+
+
+def submit(model, pk, source, author_id, stale=()):
+    args = (model, pk, source, author_id, stale)
+    if settings.IMAGE_WORKERS:
+        get_executor().submit(_run_in_worker, *args)
+    else:
+        _run(*args)
+
+
+def variant_urls(fieldfile, variants, request=None):
+    """URL миниатюр текущей картинки; {} — ещё не готовы."""
+    if not fieldfile or variants.get('source') != fieldfile.name:
+        return {}
+    urls = {}
+    for variant, name in variants.items():
+        if variant == 'source':
+            continue
+        url = fieldfile.storage.url(name)
+        urls[variant] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Profile)
+def schedule_variants(sender, instance, **kwargs):
+    field, variants_field, _, author_field = SPECS[sender]
+    source = getattr(instance, field).name
+    old = getattr(instance, variants_field)
+    if old.get('source') == source:
+        return
+    # save() не трогает поле миниатюр: в нём имена файлов прежней картинки.
+    stale = [name for variant, name in old.items() if variant != 'source']
+    if not source and not stale:
+        return
+    args = (
+        sender, instance.pk, source, getattr(instance, author_field), stale
+    )
+    transaction.on_commit(lambda: submit(*args))
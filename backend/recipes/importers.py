@@ -0,0 +1,156 @@
+"""
+Пакетный импорт ингредиентов из CSV/JSON.
+
+Файл читается потоково, дубликаты отсекаются в памяти по уже
+загруженным парам (название, единица), а новые записи пишутся
+bulk_create пачками внутри одной транзакции.
+"""
+import csv
+import json
+import os
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from .autocomplete import ingredient_index
+from .conditional import bump_version
+from .models import Ingredient
+
+ImportStats = namedtuple('ImportStats', 'read created skipped seconds')
+
+
+def read_csv(fileobj):
+    """Строки «название,единица»; заголовок необязателен."""
+    for row in csv.reader(fileobj):
+        if len(row) < 2 or row[:2] == ['name', 'measurement_unit']:
+            continue
+        yield row[0], row[1]
+
+
+def read_json(fileobj, chunk_size=64 * 1024):
+    """
+    Потоково разбирает JSON-массив объектов, не загружая файл целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in iter(lambda: fileobj.read(chunk_size), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started:
+                if position == len(buffer):
+                    break
+                if buffer[position] != '[':
+                    raise ValueError('Ожидается JSON-массив ингредиентов.')
+                started = True
+                position += 1
+                continue
+            if position == len(buffer) or buffer[position] == ']':
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Объект обрезан границей чанка — дочитываем.
+                break
+            yield item.get('name', ''), item.get('measurement_unit', '')
+        buffer = buffer[position:]
+    if buffer.strip() not in ('', ']'):
+        raise ValueError('Некорректный JSON в конце файла.')
+
+
+def import_ingredients(rows, batch_size=1000, dry_run=False):
+    """
+    Импортирует пары (название, единица) и возвращает ImportStats.
+    При dry_run ничего не пишет, только считает.
+    """
+    start = time.perf_counter()
+    seen = set(
+        Ingredient.objects.values_list('name', 'measurement_unit')
+        .iterator()
+    )
+    read = planned = 0
+    batch = []
+
+    def flush():
+        nonlocal planned
+        if batch and not dry_run:
+            Ingredient.objects.bulk_create(
+                batch, batch_size=batch_size, ignore_conflicts=True
+            )
+            # bulk_create не шлёт post_save.
+            ingredient_index.invalidate()
+            bump_version('ingredients')
+        planned += len(batch)
+        batch.clear()
+
+    with transaction.atomic():
+        # ignore_conflicts молча пропускает строки, вставленные другими
+        # транзакциями, поэтому созданные считаются по таблице.
+        before = 0 if dry_run else Ingredient.objects.count()
+        for name, unit in rows:
+            read += 1
+            key = (name.strip(), unit.strip())
+            if not all(key) or key in seen:
+                continue
+            seen.add(key)
+            batch.append(Ingredient(name=key[0], measurement_unit=key[1]))
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+        created = (
+            planned if dry_run else Ingredient.objects.count() - before
+        )
+    return ImportStats(
+        read, created, read - created, time.perf_counter() - start
+    )
+
+
+class IngredientImportCommand(BaseCommand):
+    """Общая основа команд import_ingredients*."""
+
+    reader = None
+    default_file = None
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            type=str,
+            help='Путь к файлу с ингредиентами'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки для bulk_create'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Разобрать файл и посчитать новые записи, ничего не записывая'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or os.path.join(
+            settings.BASE_DIR, '..', 'data', self.default_file
+        )
+        path = os.path.abspath(path)
+        with open(path, encoding='utf-8', newline='') as fileobj:
+            stats = import_ingredients(
+                self.reader(fileobj),
+                batch_size=options['batch_size'],
+                dry_run=options['dry_run']
+            )
+        rate = stats.read / stats.seconds if stats.seconds else 0
+        prefix = 'Пробный запуск. ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Импортировано ингредиентов: {stats.created}, '
+            f'пропущено: {stats.skipped}, '
+            f'прочитано {stats.read} строк за {stats.seconds:.2f} с '
+            f'({rate:.0f} строк/с)'
+        ))
@@ -0,0 +1,155 @@
+"""
+Кэш ответов списка рецептов для анонимных пользователей.
+
+Ключ — нормализованные параметры запроса и поколение списка. Поколение
+списка увеличивается при изменении рецептов, их ингредиентов и тегов
+(после коммита транзакции), а поколение автора — при изменении его
+пользователя или профиля: запись с рецептами автора становится
+недействительной, остальные страницы остаются в кэше.
+
+Хранилище — кэш Django (CACHES['default']). С LocMemCache у каждого
+воркера свой кэш и своя инвалидация, поэтому при нескольких воркерах
+стоит указать общий бэкенд; RECIPE_LIST_CACHE_TIMEOUT ограничивает
+время жизни записи в любом случае.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import Profile
+from .models import Ingredient, Recipe, RecipeIngredient, Tag
+
+User = get_user_model()
+
+PREFIX = 'recipes:list'
+LIST_GENERATION = f'{PREFIX}:gen'
+HITS = f'{PREFIX}:hits'
+MISSES = f'{PREFIX}:misses'
+
+# Параметры, от которых зависит ответ анонимному пользователю.
+KEY_PARAMS = (
+    'author', 'cursor', 'limit', 'offset', 'ordering', 'search', 'tags'
+)
+# Фильтры, которые для анонимного пользователя ничего не меняют.
+IGNORED_PARAMS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def is_enabled():
+    return settings.RECIPE_LIST_CACHE_TIMEOUT > 0
+
+
+def _author_key(author_id):
+    return f'{PREFIX}:author:{author_id}:gen'
+
+
+def _generations(keys):
+    """
+    Текущие поколения; отсутствующие заводятся значением времени,
+    чтобы после вытеснения ключа не совпасть со старыми записями.
+    """
+    found = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    for key, value in missing.items():
+        cache.add(key, value, timeout=None)
+    if missing:
+        found.update(cache.get_many(list(missing)))
+    return found
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def make_key(request):
+    """Ключ кэша или None, если запрос кэшировать нельзя."""
+    params = []
+    for name in sorted(request.query_params):
+        if name in IGNORED_PARAMS:
+            continue
+        if name not in KEY_PARAMS:
+            return None
+        params.append((name, sorted(request.query_params.getlist(name))))
+    raw = repr((request.get_host(), request.is_secure(), params))
+    digest = hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    generation = _generations([LIST_GENERATION])[LIST_GENERATION]
+    return f'{PREFIX}:{generation}:{digest}'
+
+
+def lookup(key):
+    entry = cache.get(key)
+    if entry is not None:
+        authors = entry['authors']
+        if _generations(list(authors)) == authors:
+            _count(HITS)
+            return entry['data']
+    _count(MISSES)
+    return None
+
+
+def store(key, data):
+    author_ids = {
+        recipe['author']['id'] for recipe in data.get('results', ())
+    }
+    authors = _generations([_author_key(pk) for pk in author_ids])
+    cache.set(
+        key,
+        {'data': data, 'authors': authors},
+        settings.RECIPE_LIST_CACHE_TIMEOUT
+    )
+
+
+def stats():
+    values = cache.get_many([HITS, MISSES])
+    hits, misses = values.get(HITS, 0), values.get(MISSES, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def invalidate_all():
+    _bump(LIST_GENERATION)
+
+
+def invalidate_author(author_id):
+    _bump(_author_key(author_id))
+
+
+# Удаление строк RecipeIngredient и смена тегов рецепта всегда идут
+# вместе с сохранением самого рецепта (сериализатор, админка), поэтому
+# post_delete/m2m_changed не подписаны: они отключили бы быстрое
+# удаление и добавление связей без предварительного SELECT.
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_recipe_list(sender, **kwargs):
+    transaction.on_commit(invalidate_all)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Profile)
+def invalidate_author_recipes(sender, instance, **kwargs):
+    author_id = instance.pk if sender is User else instance.user_id
+    transaction.on_commit(lambda: invalidate_author(author_id))
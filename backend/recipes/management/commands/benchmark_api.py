@@ -0,0 +1,114 @@
+import json
+import shutil
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment
+)
+
+from recipes import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер SQL-запросов и времени ответа эндпоинтов API на синтетических '
+        'данных. Данные создаются в транзакции и откатываются в конце.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=benchmark.DEFAULT_SIZES['users'],
+            help='Количество пользователей'
+        )
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=benchmark.DEFAULT_SIZES['recipes'],
+            help='Количество рецептов'
+        )
+        parser.add_argument(
+            '--subscriptions',
+            type=int,
+            default=benchmark.DEFAULT_SIZES['bench_subscriptions'],
+            help='На скольких авторов подписан пользователь запросов'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Сколько раз выполнять каждый запрос'
+        )
+        parser.add_argument(
+            '--group',
+            choices=sorted({e.group for e in benchmark.ENDPOINTS}),
+            help='Замерить только одну группу эндпоинтов'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Вывести результаты в JSON для сравнения веток'
+        )
+
+    def handle(self, *args, **options):
+        endpoints = [
+            endpoint for endpoint in benchmark.ENDPOINTS
+            if options['group'] in (None, endpoint.group)
+        ]
+        media_root = tempfile.mkdtemp()
+        setup_test_environment()
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                with transaction.atomic():
+                    ctx = benchmark.seed(
+                        {
+                            'users': options['users'],
+                            'recipes': options['recipes'],
+                            'bench_subscriptions': options['subscriptions'],
+                        },
+                        storage=FileSystemStorage(location=media_root)
+                    )
+                    results = [
+                        benchmark.measure(endpoint, ctx, options['repeat'])
+                        for endpoint in endpoints
+                    ]
+                    transaction.set_rollback(True)
+        finally:
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        if options['json']:
+            self.stdout.write(json.dumps([
+                {
+                    'endpoint': result.endpoint.name,
+                    'status': result.status,
+                    'queries': result.queries,
+                    'median_ms': round(benchmark.median_ms(result), 3),
+                    'min_ms': round(min(result.timings) * 1000, 3),
+                }
+                for result in results
+            ], ensure_ascii=False, indent=2))
+            return
+
+        width = max(len(endpoint.name) for endpoint in endpoints)
+        self.stdout.write(
+            f'{"Эндпоинт":<{width}}  {"код":>4}  {"SQL":>4}  '
+            f'{"лимит":>5}  {"медиана, мс":>11}  {"мин, мс":>8}'
+        )
+        for result in results:
+            line = (
+                f'{result.endpoint.name:<{width}}  {result.status:>4}  '
+                f'{result.queries:>4}  {result.endpoint.max_queries:>5}  '
+                f'{benchmark.median_ms(result):>11.2f}  '
+                f'{min(result.timings) * 1000:>8.2f}'
+            )
+            if (result.queries > result.endpoint.max_queries
+                    or result.status != result.endpoint.status):
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
@@ -0,0 +1,161 @@
+import asyncio
+import gc
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import AsyncClient, Client
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment
+)
+
+from recipes import benchmark
+from recipes.models import Recipe
+
+DEFAULT_PATHS = (
+    '/api/recipes/?limit=6',
+    '/api/recipes/{recipe}/',
+    '/api/ingredients/?name=%D1%81&limit=10',
+    '/api/tags/',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочное сравнение горячих GET-эндпоинтов: синхронные '
+        'viewset\'ы через WSGI-обработчик в пуле потоков против '
+        'синхронных и асинхронных view через ASGI-обработчик. Данные '
+        'берутся из текущей БД или, с --seed, из временной.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            action='append',
+            help='Эндпоинт (можно несколько); {recipe} — id рецепта'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=300,
+            help='Запросов на каждый эндпоинт и уровень конкурентности'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            nargs='+',
+            default=[1, 10, 50],
+            help='Число одновременных запросов'
+        )
+        parser.add_argument(
+            '--seed',
+            action='store_true',
+            help='Замерить на синтетических данных во временной БД '
+                 '(как у manage.py test), удаляемой после замера'
+        )
+
+    def run_wsgi(self, path, count, concurrency):
+        local = threading.local()
+
+        def request(_):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            start = time.perf_counter()
+            local.client.get(path)
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(request, range(count)))
+
+    def run_asgi(self, path, count, concurrency):
+        client = AsyncClient()
+
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def request():
+                async with semaphore, ThreadSensitiveContext():
+                    start = time.perf_counter()
+                    await client.get(path)
+                    return time.perf_counter() - start
+
+            return await asyncio.gather(*(request() for _ in range(count)))
+
+        return asyncio.run(main())
+
+    def handle(self, *args, **options):
+        if not options['seed']:
+            self.benchmark(options)
+            return
+        # Запросы идут из нескольких потоков со своими соединениями, и
+        # данные откатываемой транзакции им не видны — поэтому временная
+        # база и временный MEDIA_ROOT, как у тестов.
+        media_root = tempfile.mkdtemp()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                benchmark.seed(storage=FileSystemStorage(location=media_root))
+                self.benchmark(options)
+        finally:
+            # Соединения завершившихся потоков закрываются при сборке
+            # мусора, иначе PostgreSQL не даст удалить базу.
+            gc.collect()
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def benchmark(self, options):
+        recipe = Recipe.objects.values_list('id', flat=True).first()
+        paths = [
+            path.format(recipe=recipe)
+            for path in options['path'] or DEFAULT_PATHS
+        ]
+        # ASGI с синхронными viewset'ами отделяет накладные расходы
+        # самого ASGI-обработчика от выигрыша асинхронных view.
+        modes = (
+            ('WSGI', 'foodgram.urls', self.run_wsgi),
+            ('ASGI/sync', 'foodgram.urls', self.run_asgi),
+            ('ASGI', 'foodgram.urls_async', self.run_asgi),
+        )
+        width = max(map(len, paths))
+        self.stdout.write(
+            f'{"Эндпоинт":<{width}}  {"режим":<9}  {"конк.":>5}  '
+            f'{"зап/с":>8}  {"медиана, мс":>11}  {"p95, мс":>8}'
+        )
+        setup_test_environment()
+        try:
+            # Кэш анонимных списков отключён, чтобы мерить сам путь
+            # запроса, а не попадания в кэш.
+            with override_settings(RECIPE_LIST_CACHE_TIMEOUT=0):
+                for path in paths:
+                    for concurrency in options['concurrency']:
+                        for mode, urlconf, run in modes:
+                            with override_settings(ROOT_URLCONF=urlconf):
+                                start = time.perf_counter()
+                                timings = run(
+                                    path, options['requests'], concurrency)
+                                elapsed = time.perf_counter() - start
+                            self.write_row(
+                                path, width, mode, concurrency,
+                                timings, elapsed)
+        finally:
+            teardown_test_environment()
+
+    def write_row(self, path, width, mode, concurrency, timings, elapsed):
+        p95 = statistics.quantiles(timings, n=20)[-1]
+        self.stdout.write(
+            f'{path:<{width}}  {mode:<9}  {concurrency:>5}  '
+            f'{len(timings) / elapsed:>8.0f}  '
+            f'{statistics.median(timings) * 1000:>11.2f}  '
+            f'{p95 * 1000:>8.2f}'
+        )
@@ -0,0 +1,83 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    setup_test_environment,
+    teardown_test_environment
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Время ответа эндпоинта при новом соединении с БД на каждый '
+        'запрос и при постоянном соединении (или пуле из DB_POOL).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default='/api/tags/',
+            help='Эндпоинт для замера (анонимный GET)'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Сколько запросов выполнить в каждом режиме'
+        )
+
+    def measure(self, client, path, count, max_age):
+        # Тестовый клиент шлёт request_finished, как и настоящий сервер,
+        # поэтому close_old_connections закрывает соединение по
+        # CONN_MAX_AGE ровно так же, как в воркере gunicorn.
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client.get(path)
+            timings.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            self.stderr.write(f'{path}: код ответа {response.status_code}')
+        return timings
+
+    def handle(self, *args, **options):
+        pooled = 'pool' in connection.settings_dict['OPTIONS']
+        modes = {
+            'пул соединений' if pooled else 'соединение на запрос': 0,
+            'постоянное соединение': None,
+        }
+        if pooled:
+            # Django не допускает CONN_MAX_AGE вместе с пулом.
+            del modes['постоянное соединение']
+        initial = connection.settings_dict['CONN_MAX_AGE']
+        client = Client()
+        setup_test_environment()
+        try:
+            results = {
+                mode: self.measure(
+                    client, options['path'], options['requests'], max_age)
+                for mode, max_age in modes.items()
+            }
+        finally:
+            connection.settings_dict['CONN_MAX_AGE'] = initial
+            teardown_test_environment()
+
+        width = max(map(len, results))
+        self.stdout.write(
+            f'{connection.vendor}, {options["path"]}, '
+            f'{options["requests"]} запросов'
+        )
+        self.stdout.write(
+            f'{"Режим":<{width}}  {"медиана, мс":>11}  {"p95, мс":>8}'
+        )
+        for mode, timings in results.items():
+            p95 = statistics.quantiles(timings, n=20)[-1]
+            self.stdout.write(
+                f'{mode:<{width}}  '
+                f'{statistics.median(timings) * 1000:>11.2f}  '
+                f'{p95 * 1000:>8.2f}'
+            )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from recipes import search
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересборка полнотекстового индекса рецептов: после массовых '
+        'загрузок в обход сигналов или смены SEARCH_CONFIG'
+    )
+
+    def handle(self, *args, **options):
+        kind = search.backend()
+        if kind is None:
+            self.stdout.write(self.style.WARNING(
+                'Полнотекстового индекса нет, поиск идёт по названию'))
+            return
+        search.reindex()
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано рецептов: {Recipe.objects.count()} ({kind})'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.shopping_list import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверка материализованных списков покупок с корзинами '
+        'и исправление расхождений'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать расхождения, ничего не записывая'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stale = rebuild(dry_run=options['dry_run'])
+        verb = 'Разошлось' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: недостающих позиций — {stale["created"]}, '
+            f'неверных сумм — {stale["updated"]}, '
+            f'лишних позиций — {stale["deleted"]}'
+        ))
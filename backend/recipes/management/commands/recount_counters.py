@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import recount
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчёт денормализованных счётчиков избранного, корзин, '
+        'рецептов и подписчиков'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать разошедшиеся строки, ничего не записывая'
+        )
+
+    def handle(self, *args, **options):
+        stale = recount(dry_run=options['dry_run'])
+        verb = 'Разошлось' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: рецептов — {stale["recipes"]}, '
+            f'профилей — {stale["profiles"]}'
+        ))
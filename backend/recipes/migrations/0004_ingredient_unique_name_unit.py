@@ -0,0 +1,60 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:46
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """
+    Схлопывает повторы (название, единица), которые допускал прежний
+    загрузчик: строки рецептов переводятся на ингредиент с наименьшим
+    pk (если он в рецепте уже есть — количества складываются), лишние
+    ингредиенты удаляются.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    groups = (
+        Ingredient.objects.values('name', 'measurement_unit')
+        .annotate(keep=Min('pk'), total=Count('pk'))
+        .filter(total__gt=1)
+    )
+    for group in list(groups):
+        keep = group['keep']
+        others = list(
+            Ingredient.objects.filter(
+                name=group['name'],
+                measurement_unit=group['measurement_unit']
+            ).exclude(pk=keep).values_list('pk', flat=True)
+        )
+        for row in RecipeIngredient.objects.filter(
+                ingredient_id__in=others).order_by('pk'):
+            kept = RecipeIngredient.objects.filter(
+                recipe_id=row.recipe_id, ingredient_id=keep).first()
+            if kept is None:
+                row.ingredient_id = keep
+                row.save(update_fields=['ingredient'])
+            else:
+                kept.amount += row.amount
+                kept.save(update_fields=['amount'])
+                row.delete()
+        Ingredient.objects.filter(pk__in=others).delete()
+    if schema_editor.connection.vendor == 'postgresql':
+        # Отложенные проверки внешних ключей должны сработать до ALTER
+        # TABLE в той же транзакции.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_shoppingcart'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_name_unit'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+# istartswith на PostgreSQL выполняется как UPPER("name"::text) LIKE 'X%';
+# индекс по тому же выражению с text_pattern_ops позволяет искать по
+# префиксу без полного просмотра таблицы при любой локали.
+INDEX_NAME = 'recipes_ingredient_name_prefix_idx'
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON recipes_ingredient '
+        f'(UPPER(name::text) text_pattern_ops)'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_ingredient_unique_name_unit'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
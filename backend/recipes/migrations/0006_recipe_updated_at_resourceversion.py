@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:51
+
+from django.db import migrations, models
+
+
+def create_versions(apps, schema_editor):
+    ResourceVersion = apps.get_model('recipes', 'ResourceVersion')
+    for resource in ('tags', 'ingredients'):
+        ResourceVersion.objects.get_or_create(resource=resource)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_ingredient_name_prefix_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceVersion',
+            fields=[
+                ('resource', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Версия ресурса',
+                'verbose_name_plural': 'Версии ресурсов',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Изменён'),
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.db import migrations, transaction
+from django.db.utils import OperationalError
+
+# Структуры полнотекстового поиска (см. recipes/search.py) создаются
+# SQL-запросами: модели не зависят от django.contrib.postgres, а FTS5
+# есть только в SQLite. Заполнение повторяет search.reindex(), чтобы
+# миграция не зависела от кода приложения.
+FTS_TABLE = 'recipes_recipe_fts'
+INDEX_NAME = 'recipes_recipe_search_idx'
+
+INGREDIENT_NAMES = '''
+    SELECT {concat} FROM recipes_recipeingredient ri
+    JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+    WHERE ri.recipe_id = recipes_recipe.id
+'''
+
+
+def create_search(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE recipes_recipe '
+            'ADD COLUMN IF NOT EXISTS search_vector tsvector'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+            f'ON recipes_recipe USING gin (search_vector)'
+        )
+        names = INGREDIENT_NAMES.format(concat="string_agg(i.name, ' ')")
+        schema_editor.execute(
+            f'''UPDATE recipes_recipe SET search_vector =
+                setweight(to_tsvector(%(config)s::regconfig, name), 'A')
+                || setweight(to_tsvector(%(config)s::regconfig,
+                                         coalesce(({names}), '')), 'B')
+                || setweight(to_tsvector(%(config)s::regconfig, text), 'C')
+            ''',
+            {'config': settings.SEARCH_CONFIG}
+        )
+    elif connection.vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=connection.alias):
+                schema_editor.execute(
+                    f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+                    f'name, ingredients, text, '
+                    f"tokenize = 'unicode61 remove_diacritics 2')"
+                )
+        except OperationalError:
+            # SQLite собран без FTS5 — останется поиск icontains.
+            return
+        # Столбец rank: bm25 с весами name, ingredients, text.
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) "
+            f"VALUES ('rank', 'bm25(10.0, 4.0, 1.0)')"
+        )
+        names = INGREDIENT_NAMES.format(concat="group_concat(i.name, ' ')")
+        schema_editor.execute(
+            f'''INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text)
+            SELECT id, name, coalesce(({names}), ''), text
+            FROM recipes_recipe'''
+        )
+
+
+def drop_search(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+        schema_editor.execute(
+            'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector')
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
@@ -1,7 +1,10 @@
 from django.db import models
+from django.db.models import BooleanField, Exists, OuterRef, Prefetch, Value
 from django.contrib.auth import get_user_model
 from django.conf import settings
 
+from users.models import CountersModelMixin, Subscription
+
 User = get_user_model()
 
 
@@ -19,6 +22,12 @@ class Ingredient(models.Model):
         verbose_name = "Ингредиент"
         verbose_name_plural = "Ингредиенты"
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_name_unit'
+            )
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.measurement_unit})"
@@ -50,12 +59,54 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+def ingredients_prefetch():
+    return Prefetch(
+        'recipeingredient_set',
+        queryset=RecipeIngredient.objects.select_related('ingredient')
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def with_author(self):
+        return self.select_related('author__profile')
+
+    def with_related(self):
+        """Автор с профилем и ингредиенты — фиксированным числом запросов."""
+        return self.with_author().prefetch_related(ingredients_prefetch())
+
+    def with_user_flags(self, user):
+        """
+        Аннотирует is_favorited, is_in_shopping_cart и author_is_subscribed
+        подзапросами EXISTS вместо отдельного запроса на каждый рецепт.
+        """
+        if not user.is_authenticated:
+            false = Value(False, output_field=BooleanField())
+            return self.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+                author_is_subscribed=false,
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author'))),
+        )
+
+
+class Recipe(CountersModelMixin, models.Model):
+    COUNTER_FIELDS = ('favorites_count', 'carts_count')
+
+    # Отдельный индекс не нужен: author — префикс recipe_author_id_idx.
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='recipes',
-        verbose_name="Автор"
+        verbose_name="Автор",
+        db_index=False
     )
     name = models.CharField(
         max_length=200,
@@ -82,11 +133,42 @@ class Recipe(models.Model):
     cooking_time = models.PositiveIntegerField(
         verbose_name="Время приготовления (мин)"
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Изменён"
+    )
+    # Миниатюры WebP, см. recipes/images.py.
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Миниатюры"
+    )
+    # Денормализованные счётчики, см. recipes/counters.py.
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="В избранном"
+    )
+    carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="В корзинах"
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
         ordering = ['-id']
+        indexes = [
+            # Рецепты автора в порядке ленты и подписок.
+            models.Index(
+                fields=['author', '-id'],
+                name='recipe_author_id_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -123,42 +205,137 @@ class RecipeIngredient(models.Model):
 
 
 class Favorite(models.Model):
+    # Оба поля — префиксы составных индексов из Meta, отдельные
+    # индексы по ним не нужны.
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='favorites'
+        related_name='favorites',
+        db_index=False
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
-        related_name='favorited_by'
+        related_name='favorited_by',
+        db_index=False
     )
 
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
-        unique_together = ('user', 'recipe')
+        constraints = [
+            # Он же индекс (user, recipe) для флагов в списке рецептов.
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorite_user_recipe'
+            )
+        ]
+        indexes = [
+            # Выборки и счётчики по рецепту, каскадное удаление рецепта.
+            models.Index(
+                fields=['recipe', 'user'],
+                name='favorite_recipe_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user} — {self.recipe}"
 
 
 class ShoppingCart(models.Model):
+    # Оба поля — префиксы составных индексов из Meta, отдельные
+    # индексы по ним не нужны.
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='shopping_cart'
+        related_name='shopping_cart',
+        db_index=False
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
-        related_name='in_shopping_carts'
+        related_name='in_shopping_carts',
+        db_index=False
     )
 
     class Meta:
         verbose_name = 'Корзина покупок'
         verbose_name_plural = 'Корзина покупок'
-        unique_together = ('user', 'recipe')
+        constraints = [
+            # Он же индекс (user, recipe) для флагов в списке рецептов.
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_shoppingcart_user_recipe'
+            )
+        ]
+        indexes = [
+            # Выборки и счётчики по рецепту, каскадное удаление рецепта.
+            models.Index(
+                fields=['recipe', 'user'],
+                name='shoppingcart_recipe_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user} — {self.recipe}"
+
+
+class ShoppingListItem(models.Model):
+    """
+    Готовый список покупок: сумма ингредиента по рецептам в корзине
+    пользователя. Поддерживается в recipes/shopping_list.py.
+    """
+    # user — префикс уникального ограничения.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        db_index=False
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name="Ингредиент"
+    )
+    total_amount = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Количество"
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shoppinglistitem_user_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user} — {self.ingredient}: {self.total_amount}"
+
+
+class ResourceVersion(models.Model):
+    """
+    Счётчик поколений данных для ETag: увеличивается при каждом
+    изменении ресурса (тегов, ингредиентов) и общий для всех воркеров.
+    """
+    resource = models.CharField(
+        max_length=50,
+        primary_key=True
+    )
+    version = models.PositiveBigIntegerField(
+        default=0
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True
+    )
+
+    class Meta:
+        verbose_name = 'Версия ресурса'
+        verbose_name_plural = 'Версии ресурсов'
+
+    def __str__(self):
+        return f"{self.resource}: {self.version}"
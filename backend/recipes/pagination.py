@@ -0,0 +1,33 @@
+from rest_framework.pagination import CursorPagination
+
+
+class RecipeCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация по -id: страница выбирается условием id < курсора,
+    без OFFSET и без COUNT(*). Пустой ?cursor= — первая страница.
+    ?ordering= на неё не влияет: курсор по неуникальному полю снова
+    требовал бы смещения.
+    """
+    ordering = '-id'
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def decode_cursor(self, request):
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
+
+    def get_ordering(self, request, queryset, view):
+        return (self.ordering,)
+
+
+class RecipeFeedPagination(RecipeCursorPagination):
+    """
+    Лента подписок (/api/recipes/feed/): всегда курсор по -id, без
+    переключения через ?cursor= и без влияния ?ordering=.
+    """
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        return ('-id',)
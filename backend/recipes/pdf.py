@@ -0,0 +1,235 @@
+"""
+PDF списка покупок.
+
+Страницы A4 рисует Pillow (он уже нужен для миниатюр) шрифтом
+SHOPPING_LIST_PDF_FONT и сохраняет их в PDF. Сборка идёт в пуле
+потоков, готовый файл кладётся в SHOPPING_LIST_PDF_DIR под именем —
+хэшем содержимого списка: повторные скачивания без изменений корзины
+и одинаковые корзины разных пользователей отдаются с диска, а
+одновременные запросы с одним списком делят одну сборку. Если файл не
+готов за SHOPPING_LIST_PDF_WAIT секунд (доли секунды: воркер не должен
+простаивать), ответ — 202 с Retry-After, клиент повторяет запрос, а
+сборка продолжается. Ошибка сборки — 503 с Retry-After и запись в лог.
+Когда файлов в каталоге больше SHOPPING_LIST_PDF_MAX_FILES, давно не
+скачанные удаляются. При SHOPPING_LIST_PDF_WORKERS=0 PDF собирается в
+потоке запроса.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import suppress
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, JsonResponse
+from PIL import Image, ImageDraw, ImageFont
+
+from foodgram import metrics
+
+logger = logging.getLogger(__name__)
+
+# Меняется вместе с вёрсткой, чтобы не отдавать старые файлы.
+LAYOUT_VERSION = 1
+DPI = 150
+PAGE_SIZE = (1240, 1754)  # A4 при 150 dpi
+MARGIN = 100
+TITLE_SIZE = 40
+FONT_SIZE = 26
+LINE_HEIGHT = 44
+BOX_SIZE = 22
+
+_executor = None
+_lock = threading.RLock()
+_pending = {}
+# Каталог: сколько в нём PDF по подсчёту этого процесса.
+_counts = {}
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.SHOPPING_LIST_PDF_WORKERS,
+                thread_name_prefix='shopping-pdf'
+            )
+    return _executor
+
+
+def cache_path(rows):
+    payload = json.dumps(
+        [LAYOUT_VERSION, settings.SHOPPING_LIST_PDF_FONT, rows],
+        ensure_ascii=False
+    )
+    key = hashlib.sha256(payload.encode()).hexdigest()
+    return Path(settings.SHOPPING_LIST_PDF_DIR) / f'{key}.pdf'
+
+
+def load_font(size):
+    try:
+        return ImageFont.truetype(settings.SHOPPING_LIST_PDF_FONT, size)
+    except OSError:
+        logger.warning(
+            'Шрифт %s не найден: кириллица в PDF не отобразится',
+            settings.SHOPPING_LIST_PDF_FONT)
+        return ImageFont.load_default(size)
+
+
+def fit(draw, text, font, width):
+    """Обрезает текст с многоточием, если он шире width."""
+    if draw.textlength(text, font=font) <= width:
+        return text
+    # Двоичный поиск: замер длины строки — самая дорогая часть вёрстки.
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if draw.textlength(text[:middle] + '…', font=font) <= width:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + '…'
+
+
+def render_pages(rows):
+    font, title_font = load_font(FONT_SIZE), load_font(TITLE_SIZE)
+    width = PAGE_SIZE[0] - 2 * MARGIN - BOX_SIZE * 2
+    pages = []
+
+    def new_page():
+        page = Image.new('1', PAGE_SIZE, 1)
+        pages.append(page)
+        return ImageDraw.Draw(page), MARGIN
+
+    draw, y = new_page()
+    draw.text((MARGIN, y), 'Список покупок', font=title_font, fill=0)
+    y += TITLE_SIZE * 2
+    if not rows:
+        draw.text((MARGIN, y), 'Корзина пуста', font=font, fill=0)
+    for name, unit, amount in rows:
+        if y + LINE_HEIGHT > PAGE_SIZE[1] - MARGIN:
+            draw, y = new_page()
+        top = y + (FONT_SIZE - BOX_SIZE) // 2 + 4
+        draw.rectangle(
+            (MARGIN, top, MARGIN + BOX_SIZE, top + BOX_SIZE),
+            outline=0, width=2)
+        # Обрезается только название: единица и количество видны всегда.
+        suffix = f' ({unit}) — {amount}'
+        name = fit(
+            draw, name, font, width - draw.textlength(suffix, font=font))
+        draw.text(
+            (MARGIN + BOX_SIZE * 2, y), name + suffix, font=font, fill=0)
+        y += LINE_HEIGHT
+    return pages
+
+
+def prune(directory):
+    """
+    Оставляет три четверти MAX_FILES самых свежих по mtime файлов,
+    чтобы следующая чистка понадобилась не через одну сборку.
+    Возвращает, сколько файлов осталось.
+    """
+    files = []
+    for path in directory.glob('*.pdf'):
+        try:
+            files.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            continue
+    files.sort(reverse=True)
+    keep = max(settings.SHOPPING_LIST_PDF_MAX_FILES * 3 // 4, 1)
+    for _, path in files[keep:]:
+        path.unlink(missing_ok=True)
+    return min(len(files), keep)
+
+
+def count_build(directory):
+    """Учитывает новый файл и чистит каталог, если файлов больше лимита."""
+    with _lock:
+        count = _counts.get(directory)
+        if count is None:
+            count = sum(1 for _ in directory.glob('*.pdf'))
+        else:
+            count += 1
+        if count > settings.SHOPPING_LIST_PDF_MAX_FILES:
+            count = prune(directory)
+        _counts[directory] = count
+
+
+def build(rows, path):
+    pages = render_pages(rows)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'{path.stem}.{threading.get_ident()}.tmp')
+    pages[0].save(
+        tmp, 'PDF', save_all=True, append_images=pages[1:], resolution=DPI)
+    os.replace(tmp, path)
+    count_build(path.parent)
+
+
+def _forget(path):
+    with _lock:
+        _pending.pop(path, None)
+
+
+def open_cached(path):
+    """Открытый файл из кэша или None, если его нет (или уже удалили)."""
+    try:
+        fileobj = path.open('rb')
+    except FileNotFoundError:
+        return None
+    # mtime — время последнего скачивания для prune().
+    with suppress(FileNotFoundError):
+        os.utime(path)
+    return fileobj
+
+
+def ensure_pdf(rows, timeout):
+    """Открытый готовый PDF или None, если сборка ещё идёт."""
+    path = cache_path(rows)
+    fileobj = open_cached(path)
+    if fileobj is not None:
+        metrics.inc('foodgram_shopping_list_pdf_total', result='hit')
+        return fileobj
+    metrics.inc('foodgram_shopping_list_pdf_total', result='miss')
+    if not settings.SHOPPING_LIST_PDF_WORKERS:
+        build(rows, path)
+        return open_cached(path)
+    with _lock:
+        future = _pending.get(path)
+        if future is None:
+            future = _pending[path] = get_executor().submit(build, rows, path)
+            future.add_done_callback(lambda _: _forget(path))
+    try:
+        future.result(timeout)
+    except FutureTimeoutError:
+        return None
+    # Файл могла удалить чистка после другой сборки — тогда тоже 202,
+    # повторный запрос соберёт его заново.
+    return open_cached(path)
+
+
+def retry_response(detail, status):
+    response = JsonResponse({'detail': detail}, status=status)
+    response['Retry-After'] = '1'
+    return response
+
+
+def pdf_response(rows):
+    try:
+        fileobj = ensure_pdf(rows, settings.SHOPPING_LIST_PDF_WAIT)
+    except Exception:
+        logger.exception('Не удалось собрать PDF списка покупок')
+        metrics.inc('foodgram_shopping_list_pdf_total', result='error')
+        return retry_response(
+            'Не удалось собрать список покупок, повторите запрос.', 503)
+    if fileobj is None:
+        return retry_response(
+            'Список покупок готовится, повторите запрос.', 202)
+    return FileResponse(
+        fileobj,
+        as_attachment=True,
+        filename='shopping_list.pdf',
+        content_type='application/pdf'
+    )
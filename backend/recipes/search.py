@@ -0,0 +1,186 @@
+"""
+Полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+
+На PostgreSQL документ рецепта — столбец recipes_recipe.search_vector
+(tsvector с весами A/B/C) под GIN-индексом, на SQLite — виртуальная
+таблица FTS5 recipes_recipe_fts с rowid = id рецепта. Оба создаёт
+миграция 0010_recipe_search в обход моделей, чтобы модели не зависели
+от django.contrib.postgres. Если ни того, ни другого нет (другая СУБД,
+SQLite без FTS5), поиск — прежний icontains по названию.
+
+Документ пересчитывается после коммита транзакции, в которой менялись
+рецепт, его ингредиенты или названия ингредиентов: сериализатор
+синхронизирует ингредиенты массовыми запросами уже после сохранения
+рецепта. rebuild_search_index пересобирает документы всех рецептов.
+Каждое слово запроса ищется как префикс, все слова обязательны.
+"""
+import re
+from functools import reduce
+from operator import and_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Ingredient, Recipe, RecipeIngredient
+
+FTS_TABLE = 'recipes_recipe_fts'
+MAX_TERMS = 8
+BATCH_SIZE = 500
+
+WORD = re.compile(r'\w+')
+
+_fts_available = None
+
+INGREDIENT_NAMES = '''
+    SELECT {concat} FROM recipes_recipeingredient ri
+    JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+    WHERE ri.recipe_id = recipes_recipe.id
+'''
+
+POSTGRES_UPDATE = f'''
+    UPDATE recipes_recipe SET search_vector =
+        setweight(to_tsvector(%(config)s::regconfig, name), 'A')
+        || setweight(to_tsvector(%(config)s::regconfig, coalesce(({
+            INGREDIENT_NAMES.format(concat="string_agg(i.name, ' ')")
+        }), '')), 'B')
+        || setweight(to_tsvector(%(config)s::regconfig, text), 'C')
+'''
+
+SQLITE_INSERT = f'''
+    INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text)
+    SELECT id, name, coalesce(({
+        INGREDIENT_NAMES.format(concat="group_concat(i.name, ' ')")
+    }), ''), text FROM recipes_recipe
+'''
+
+
+def backend():
+    """'postgresql', 'sqlite' или None — поиск без индекса."""
+    global _fts_available
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor != 'sqlite':
+        return None
+    if _fts_available is None:
+        _fts_available = (
+            FTS_TABLE in connection.introspection.table_names())
+    return 'sqlite' if _fts_available else None
+
+
+def _batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def reindex(recipe_ids=None):
+    """Пересчитывает документы рецептов (всех, если recipe_ids=None)."""
+    kind = backend()
+    if kind is None:
+        return
+    with connection.cursor() as cursor:
+        if kind == 'postgresql':
+            params = {'config': settings.SEARCH_CONFIG}
+            if recipe_ids is None:
+                cursor.execute(POSTGRES_UPDATE, params)
+            for batch in _batches(recipe_ids or ()):
+                cursor.execute(
+                    POSTGRES_UPDATE + ' WHERE id = ANY(%(ids)s)',
+                    {**params, 'ids': batch})
+            return
+        if recipe_ids is None:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(SQLITE_INSERT)
+        for batch in _batches(recipe_ids or ()):
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+                batch)
+            cursor.execute(
+                f'{SQLITE_INSERT} WHERE id IN ({placeholders})', batch)
+
+
+def search(queryset, terms):
+    """
+    Рецепты queryset, подходящие под все слова terms, по убыванию
+    релевантности (аннотация search_rank), при равенстве — новые выше.
+    """
+    words = [
+        word for term in terms for word in WORD.findall(term.lower())
+    ][:MAX_TERMS]
+    if not words:
+        return queryset
+    kind = backend()
+    if kind is None:
+        return queryset.filter(
+            reduce(and_, (Q(name__icontains=word) for word in words)))
+    if kind == 'postgresql':
+        query = ' & '.join(f'{word}:*' for word in words)
+        tsquery = 'to_tsquery(%s::regconfig, %s)'
+        params = (settings.SEARCH_CONFIG, query)
+        return queryset.filter(RawSQL(
+            f'recipes_recipe.search_vector @@ {tsquery}', params,
+            output_field=BooleanField()
+        )).annotate(search_rank=RawSQL(
+            f'ts_rank(recipes_recipe.search_vector, {tsquery})', params,
+            output_field=FloatField()
+        )).order_by('-search_rank', '-id')
+    # Соединение с FTS-таблицей, а не коррелированный подзапрос: bm25
+    # (столбец rank) считается один раз на найденную строку. Связи
+    # модели у виртуальной таблицы нет, поэтому extra().
+    match = ' AND '.join(f'"{word}"*' for word in words)
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = recipes_recipe.id',
+            f'{FTS_TABLE} MATCH %s',
+        ],
+        params=[match],
+        select={'search_rank': f'-{FTS_TABLE}.rank'},
+    ).order_by('-search_rank', '-id')
+
+
+def schedule_reindex(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(lambda: reindex(recipe_ids))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    schedule_reindex([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, **kwargs):
+    schedule_reindex([instance.recipe_id])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    # Строка recipes_recipe с search_vector удаляется сама.
+    if backend() == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    if not created:
+        schedule_reindex(_recipes_with(instance))
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    # Строки RecipeIngredient удалятся каскадом, рецепты — останутся.
+    schedule_reindex(_recipes_with(instance))
+
+
+def _recipes_with(ingredient):
+    return RecipeIngredient.objects.filter(
+        ingredient=ingredient).values_list('recipe_id', flat=True)
@@ -1,13 +1,21 @@
+from django.db import transaction
 from rest_framework import serializers
-from .fields import Base64ImageField
+from .fields import (
+    Base64ImageField,
+    BulkPrimaryKeyRelatedField,
+    resolve_pks
+)
+from .images import variant_urls
 from .models import (
     Ingredient,
     Tag,
     Recipe,
     RecipeIngredient,
     Favorite,
-    ShoppingCart
+    ShoppingCart,
+    ShoppingListItem
 )
+from .shopping_list import recipe_ingredients_change
 from users.serializers import CustomUserSerializer
 
 
@@ -56,6 +64,19 @@ class RecipeIngredientReadSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+    amount = serializers.ReadOnlyField(source='total_amount')
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
     author = CustomUserSerializer(read_only=True)
     ingredients = RecipeIngredientReadSerializer(
@@ -64,6 +85,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         read_only=True
     )
     image = serializers.ImageField(read_only=True)
+    image_variants = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -72,10 +94,24 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time'
+            'name', 'image', 'image_variants', 'text', 'cooking_time'
         )
 
+    def to_representation(self, instance):
+        # Подписка на автора приходит аннотацией рецепта, а
+        # CustomUserSerializer читает её с самого пользователя.
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
+    def get_image_variants(self, obj):
+        """URL WebP-миниатюр card/detail; {} — пока не построены."""
+        return variant_urls(
+            obj.image, obj.image_variants, self.context.get('request'))
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         return (
             user.is_authenticated
@@ -83,6 +119,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         return (
             user.is_authenticated
@@ -90,9 +128,24 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
 
 
+class RecipeIngredientListSerializer(serializers.ListSerializer):
+    """Ингредиенты всего рецепта находятся одним запросом."""
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ingredients = resolve_pks(
+            Ingredient.objects.all(),
+            [item['ingredient'] for item in items],
+            'Несуществующие ингредиенты: {ids}.'
+        )
+        for item, ingredient in zip(items, ingredients):
+            item['ingredient'] = ingredient
+        return items
+
+
 class RecipeIngredientWriteSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
+    # id проверяется списком в RecipeIngredientListSerializer.
+    id = serializers.IntegerField(
         source='ingredient',
         write_only=True
     )
@@ -100,15 +153,17 @@ class RecipeIngredientWriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount')
+        list_serializer_class = RecipeIngredientListSerializer
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
     ingredients = RecipeIngredientWriteSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True,
-        required=False
+        required=False,
+        missing_message='Несуществующие теги: {ids}.'
     )
 
     class Meta:
@@ -160,6 +215,43 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
         return data
 
+    @staticmethod
+    def _sync_ingredients(recipe, ingredients, created=False):
+        """
+        Приводит ингредиенты рецепта к переданному списку:
+        новые — bulk_create, изменённые количества — bulk_update,
+        убранные — одним DELETE. Совпадающие строки не трогаются.
+        Списки покупок тех, у кого рецепт в корзине, пересчитываются.
+        """
+        wanted = {ing['ingredient'].pk: ing['amount'] for ing in ingredients}
+        current = {} if created else {
+            ri.ingredient_id: ri for ri in recipe.recipeingredient_set.all()
+        }
+        removed = [
+            ri.pk for pk, ri in current.items() if pk not in wanted
+        ]
+        changed = []
+        for pk, ri in current.items():
+            if pk in wanted and ri.amount != wanted[pk]:
+                ri.amount = wanted[pk]
+                changed.append(ri)
+        added = [
+            RecipeIngredient(recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in wanted.items() if pk not in current
+        ]
+        if created:
+            RecipeIngredient.objects.bulk_create(added)
+            return
+        if not (removed or changed or added):
+            return
+        with recipe_ingredients_change(recipe.pk):
+            if removed:
+                RecipeIngredient.objects.filter(pk__in=removed).delete()
+            if changed:
+                RecipeIngredient.objects.bulk_update(changed, ['amount'])
+            RecipeIngredient.objects.bulk_create(added)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags', [])
@@ -169,14 +261,10 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             **validated_data
         )
         recipe.tags.set(tags)
-        for ing in ingredients:
-            RecipeIngredient.objects.create(
-                recipe=recipe,
-                ingredient=ing['ingredient'],
-                amount=ing['amount']
-            )
+        self._sync_ingredients(recipe, ingredients, created=True)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ings = validated_data.pop('ingredients', None)
         tags = validated_data.pop('tags', None)
@@ -186,13 +274,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         if tags is not None:
             instance.tags.set(tags)
         if ings is not None:
-            instance.recipeingredient_set.all().delete()
-            for ing in ings:
-                RecipeIngredient.objects.create(
-                    recipe=instance,
-                    ingredient=ing['ingredient'],
-                    amount=ing['amount']
-                )
+            self._sync_ingredients(instance, ings)
         instance.save()
         return instance
 
@@ -235,3 +317,18 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
             user=self.context['request'].user,
             recipe=validated_data['recipe']
         )
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Id рецептов для пакетного избранного и корзины, без повторов."""
+
+    MAX_RECIPES = 100
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_RECIPES
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
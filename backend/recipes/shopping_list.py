@@ -0,0 +1,259 @@
+"""
+Список покупок: материализованные суммы ингредиентов из корзины
+(ShoppingListItem) и потоковая выдача файла в txt, csv или json;
+PDF собирается в фоне и кэшируется на диске (recipes/pdf.py).
+
+Суммы меняются инкрементально в тех же транзакциях, что и корзина:
+добавление рецептов прибавляет их ингредиенты одним INSERT ... ON
+CONFLICT DO UPDATE, удаление вычитает одним UPDATE. Изменение
+ингредиентов рецепта в корзинах — вычесть старый состав до правки и
+прибавить новый после (recipe_ingredients_change). Позиции с нулём не
+удаляются, а пропускаются при чтении и переиспользуются при следующем
+добавлении. Правки корзин в админке и bulk-операции суммы не трогают —
+их выравнивает команда rebuild_shopping_lists.
+"""
+import csv
+import json
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models import Q, Sum
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.http import StreamingHttpResponse
+
+from . import pdf
+from .models import Recipe, RecipeIngredient, ShoppingCart, ShoppingListItem
+
+FORMATS = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+    'pdf': 'application/pdf',
+}
+
+
+ADD_RECIPES = '''
+    INSERT INTO recipes_shoppinglistitem (user_id, ingredient_id, total_amount)
+    SELECT c.user_id, ri.ingredient_id, SUM(ri.amount)
+    FROM recipes_shoppingcart c
+    JOIN recipes_recipeingredient ri ON ri.recipe_id = c.recipe_id
+    WHERE c.recipe_id IN ({recipes}) {users}
+    GROUP BY c.user_id, ri.ingredient_id
+    ON CONFLICT (user_id, ingredient_id) DO UPDATE SET total_amount =
+        recipes_shoppinglistitem.total_amount + excluded.total_amount
+'''
+
+# Ниже нуля не уходим, даже если суммы разошлись с корзиной.
+REMOVE_RECIPES = '''
+    UPDATE recipes_shoppinglistitem SET total_amount = CASE
+        WHEN total_amount > ({amount}) THEN total_amount - ({amount})
+        ELSE 0 END
+    WHERE ingredient_id IN (
+        SELECT ingredient_id FROM recipes_recipeingredient
+        WHERE recipe_id IN ({recipes})
+    ) {users}
+'''
+RECIPES_AMOUNT = '''
+    SELECT SUM(ri.amount) FROM recipes_recipeingredient ri
+    WHERE ri.recipe_id IN ({recipes})
+    AND ri.ingredient_id = recipes_shoppinglistitem.ingredient_id
+'''
+CART_USERS = '''
+    AND user_id IN (
+        SELECT user_id FROM recipes_shoppingcart WHERE recipe_id = %s
+    )
+'''
+
+
+def _placeholders(ids):
+    return ', '.join(['%s'] * len(ids))
+
+
+def add_recipes(recipe_ids, user_id=None):
+    """
+    Прибавляет ингредиенты рецептов к спискам пользователя user_id или
+    всех, у кого они в корзине. Строки корзины уже должны быть.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    params = list(recipe_ids)
+    users = ''
+    if user_id is not None:
+        users = 'AND c.user_id = %s'
+        params.append(user_id)
+    sql = ADD_RECIPES.format(recipes=_placeholders(recipe_ids), users=users)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def add_recipe(recipe_id, user_id=None):
+    add_recipes([recipe_id], user_id)
+
+
+def _remove(recipe_ids, users, user_params):
+    recipes = _placeholders(recipe_ids)
+    sql = REMOVE_RECIPES.format(
+        amount=RECIPES_AMOUNT.format(recipes=recipes),
+        recipes=recipes,
+        users=users
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, recipe_ids * 3 + user_params)
+
+
+def remove_recipes(recipe_ids, user_id):
+    """Вычитает ингредиенты рецептов из списка пользователя user_id."""
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        _remove(recipe_ids, 'AND user_id = %s', [user_id])
+
+
+def remove_recipe(recipe_id, user_id=None):
+    """
+    Вычитает ингредиенты рецепта из списка user_id или из списков всех,
+    у кого рецепт в корзине (тогда — до удаления строк корзины).
+    """
+    if user_id is None:
+        _remove([recipe_id], CART_USERS, [recipe_id])
+    else:
+        remove_recipes([recipe_id], user_id)
+
+
+@contextmanager
+def recipe_ingredients_change(recipe_id):
+    """Пересчитывает вклад рецепта в списки, если он у кого-то в корзине."""
+    carted = ShoppingCart.objects.filter(recipe_id=recipe_id).exists()
+    if carted:
+        remove_recipe(recipe_id)
+    yield
+    if carted:
+        add_recipe(recipe_id)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    # Строки корзины удалятся каскадом уже после pre_delete.
+    remove_recipe(instance.pk)
+
+
+def expected_totals():
+    """Суммы, посчитанные заново по корзинам: {(user, ingredient): n}."""
+    totals = (
+        RecipeIngredient.objects
+        .filter(recipe__in_shopping_carts__isnull=False)
+        .values('recipe__in_shopping_carts__user', 'ingredient')
+        .annotate(total=Sum('amount'))
+        .filter(total__gt=0)
+        .values_list('recipe__in_shopping_carts__user', 'ingredient', 'total')
+    )
+    return {
+        (user, ingredient): total
+        for user, ingredient, total in totals.iterator()
+    }
+
+
+def rebuild(dry_run=False):
+    """
+    Сверяет ShoppingListItem с корзинами и исправляет расхождения.
+    Возвращает число созданных, исправленных и удалённых позиций.
+    """
+    expected = expected_totals()
+    stored = {
+        (user, ingredient): (pk, total)
+        for pk, user, ingredient, total in ShoppingListItem.objects
+        .filter(total_amount__gt=0)
+        .values_list('pk', 'user_id', 'ingredient_id', 'total_amount')
+        .iterator()
+    }
+    missing = [key for key in expected if key not in stored]
+    wrong = [
+        ShoppingListItem(pk=pk, total_amount=expected[key])
+        for key, (pk, total) in stored.items()
+        if key in expected and expected[key] != total
+    ]
+    extra = [pk for key, (pk, _) in stored.items() if key not in expected]
+    if not dry_run:
+        # Заодно убираем накопившиеся нулевые позиции.
+        ShoppingListItem.objects.filter(
+            Q(pk__in=extra) | Q(total_amount=0)).delete()
+        ShoppingListItem.objects.bulk_update(
+            wrong, ['total_amount'], batch_size=1000)
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(
+                    user_id=user, ingredient_id=ingredient,
+                    total_amount=expected[user, ingredient])
+                for user, ingredient in missing
+            ),
+            batch_size=1000
+        )
+    return {'created': len(missing), 'updated': len(wrong),
+            'deleted': len(extra)}
+
+
+def list_items(user):
+    """Список покупок пользователя: одно чтение по индексу (user, ...)."""
+    return (
+        ShoppingListItem.objects
+        .filter(user=user, total_amount__gt=0)
+        .select_related('ingredient')
+        .order_by('ingredient__name', 'ingredient__measurement_unit')
+    )
+
+
+def list_rows(user):
+    return list_items(user).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'total_amount')
+
+
+def render_txt(rows):
+    for name, unit, amount in rows:
+        yield f"{name} ({unit}) — {amount}\n"
+
+
+class _Echo:
+    """Псевдо-буфер: csv.writer пишет строку, а мы её сразу отдаём."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_json(rows):
+    yield '['
+    separator = ''
+    for name, unit, amount in rows:
+        yield separator + json.dumps(
+            {'name': name, 'measurement_unit': unit, 'amount': amount},
+            ensure_ascii=False
+        )
+        separator = ','
+    yield ']'
+
+
+RENDERERS = {
+    'txt': render_txt,
+    'csv': render_csv,
+    'json': render_json,
+}
+
+
+def shopping_list_response(user, fmt='txt'):
+    if fmt == 'pdf':
+        return pdf.pdf_response(list(list_rows(user)))
+    rows = list_rows(user).iterator()
+    response = StreamingHttpResponse(
+        RENDERERS[fmt](rows), content_type=FORMATS[fmt]
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{fmt}"'
+    )
+    return response
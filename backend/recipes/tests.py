@@ -1,3 +1,1153 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from pathlib import Path
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from foodgram import metrics
+from foodgram.middleware import (
+    MetricsMiddleware,
+    RequestProfilingMiddleware,
+    current_profile,
+    install_query_recorder
+)
+from recipes import (
+    batch, benchmark, counters, list_cache, pdf, search, shopping_list
+)
+from recipes.autocomplete import ingredient_index
+from recipes.fields import Base64ImageField, decode_base64
+from recipes.importers import import_ingredients, read_csv, read_json
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag
+)
+from users.models import Subscription
+
+
+class TempMediaMixin:
+    """MEDIA_ROOT — временный каталог, удаляется после тестов класса."""
+
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        cls.enterClassContext(
+            override_settings(MEDIA_ROOT=media_root, IMAGE_WORKERS=0))
+        super().setUpClass()
+
+
+class APIBenchmarkMixin(TempMediaMixin):
+    """
+    Проверяет, что эндпоинты группы укладываются в max_queries
+    и max_seconds на синтетическом наборе данных (recipes/benchmark.py).
+    """
+
+    group = None
+    sizes = None
+    max_seconds = 2.0
+
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(override_settings(PASSWORD_HASHERS=[
+            'django.contrib.auth.hashers.MD5PasswordHasher'
+        ]))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cache.clear()
+        cls.ctx = benchmark.seed(
+            cls.sizes,
+            storage=FileSystemStorage(location=settings.MEDIA_ROOT)
+        )
+
+    def setUp(self):
+        # Откат тестовой транзакции не шлёт сигналы инвалидации.
+        cache.clear()
+
+    def assertEndpointWithinBudget(self, endpoint):
+        result = benchmark.measure(endpoint, self.ctx)
+        self.assertEqual(result.status, endpoint.status, endpoint.name)
+        self.assertLessEqual(
+            result.queries, endpoint.max_queries,
+            '{}: {} запросов\n{}'.format(
+                endpoint.name, result.queries, '\n'.join(result.sql))
+        )
+        self.assertLess(max(result.timings), self.max_seconds, endpoint.name)
+        return result
+
+    def test_endpoints_within_budget(self):
+        for endpoint in benchmark.ENDPOINTS:
+            if endpoint.group == self.group:
+                with self.subTest(endpoint=endpoint.name):
+                    self.assertEndpointWithinBudget(endpoint)
+
+
+class RecipeEndpointsBenchmarkTests(APIBenchmarkMixin, TestCase):
+    group = 'recipes'
+    client_class = APIClient
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        small, large = (
+            benchmark.measure(
+                benchmark.Endpoint('list', 'recipes', 'get',
+                                   f'/api/recipes/?limit={limit}', 200, 0),
+                self.ctx
+            )
+            for limit in (6, 100)
+        )
+        self.assertEqual(small.queries, large.queries)
+
+    def test_shopping_list_totals(self):
+        expected = Counter()
+        for ri in RecipeIngredient.objects.filter(
+                recipe__in_shopping_carts__user=self.ctx['user']
+        ).select_related('ingredient'):
+            key = (ri.ingredient.name, ri.ingredient.measurement_unit)
+            expected[key] += ri.amount
+        self.client.force_authenticate(self.ctx['user'])
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=json')
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(
+            {(r['name'], r['measurement_unit']): r['amount'] for r in rows},
+            dict(expected)
+        )
+
+    def test_shopping_list_unknown_format(self):
+        self.client.force_authenticate(self.ctx['user'])
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination_walks_filtered_feed(self):
+        self.client.force_authenticate(self.ctx['user'])
+        url = f'/api/recipes/?cursor=&limit=7&tags={self.ctx["tag_slug"]}'
+        ids = []
+        while url:
+            with self.assertNumQueries(3):
+                page = self.client.get(url).json()
+            self.assertNotIn('count', page)
+            ids.extend(recipe['id'] for recipe in page['results'])
+            url = page['next']
+        self.assertEqual(ids, list(
+            Recipe.objects.filter(tags__slug=self.ctx['tag_slug'])
+            .order_by('-id').values_list('id', flat=True)
+        ))
+
+    def test_cursor_pagination_ignores_ordering(self):
+        self.client.force_authenticate(self.ctx['user'])
+        url = '/api/recipes/?cursor=&limit=7&ordering=-favorites_count'
+        ids = []
+        for _ in range(2):
+            page = self.client.get(url).json()
+            ids.extend(recipe['id'] for recipe in page['results'])
+            url = page['next']
+        self.assertEqual(ids, list(
+            Recipe.objects.order_by('-id').values_list('id', flat=True)[:14]
+        ))
+        cursor = parse_qs(urlparse(url).query)['cursor'][0]
+        position = parse_qs(base64.b64decode(cursor).decode())
+        self.assertEqual(position, {'p': [str(ids[-1])]})
+
+    def test_anonymous_list_cache(self):
+        client = APIClient()
+        url = '/api/recipes/?limit=6&offset=6'
+        self.assertEqual(client.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = client.get('/api/recipes/?offset=6&limit=6')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        author = get_user_model().objects.get(
+            pk=response.data['results'][0]['author']['id'])
+        with self.captureOnCommitCallbacks(execute=True):
+            author.profile.save()
+        self.assertEqual(client.get(url)['X-Cache'], 'MISS')
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.get(pk=self.ctx['recipe']).save()
+        self.assertEqual(client.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(client.get(url)['X-Cache'], 'HIT')
+        self.assertEqual(list_cache.stats()['hits'], 2)
+
+
+class IngredientEndpointsBenchmarkTests(APIBenchmarkMixin, TestCase):
+    group = 'ingredients'
+
+    def test_autocomplete_matches_case_insensitive_prefix(self):
+        ingredients = sorted(
+            (name.casefold(), pk)
+            for pk, name in Ingredient.objects.values_list('id', 'name')
+        )
+        for prefix in ('а', 'Кар', 'сол', 'zz'):
+            with self.subTest(prefix=prefix):
+                self.assertEqual(
+                    [row['id'] for row in ingredient_index.search(prefix)],
+                    [pk for name, pk in ingredients
+                     if name.startswith(prefix.casefold())]
+                )
+
+    def test_autocomplete_limit_and_invalidation(self):
+        response = self.client.get('/api/ingredients/?name=а&limit=3')
+        self.assertEqual(len(response.json()), 3)
+        Ingredient.objects.create(name='ЯЯЯ тест', measurement_unit='г')
+        response = self.client.get('/api/ingredients/?name=яяя')
+        self.assertEqual([row['name'] for row in response.json()],
+                         ['ЯЯЯ тест'])
+
+
+class TagEndpointsBenchmarkTests(APIBenchmarkMixin, TestCase):
+    group = 'tags'
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/tags/')
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Tag.objects.create(name='Новый', color='#ABCDEF', slug='new')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class RecipeConditionalGetTests(APIBenchmarkMixin, TestCase):
+    client_class = APIClient
+    sizes = {'users': 100, 'recipes': 200}
+
+    def test_retrieve_etag_tracks_user_flags(self):
+        self.client.force_authenticate(self.ctx['user'])
+        url = f'/api/recipes/{self.ctx["recipe"]}/'
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Favorite.objects.create(
+            user=self.ctx['user'], recipe_id=self.ctx['recipe'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_favorited'])
+
+
+class RecipeCountersTests(APIBenchmarkMixin, TestCase):
+    client_class = APIClient
+    sizes = {'users': 100, 'recipes': 200}
+
+    def test_actions_keep_counters_in_sync(self):
+        user, recipe = self.ctx['user'], self.ctx['recipe']
+        author = Recipe.objects.get(pk=recipe).author
+        self.client.force_authenticate(user)
+        self.client.post(f'/api/recipes/{recipe}/favorite/')
+        self.client.post(f'/api/recipes/{recipe}/shopping_cart/')
+        self.client.delete(f'/api/recipes/{self.ctx["favorited"]}/favorite/')
+        self.client.post(f'/api/users/{author.pk}/subscribe/')
+        self.client.delete(f'/api/recipes/{self.ctx["own_recipe"]}/')
+        self.assertEqual(
+            counters.recount(dry_run=True), {'recipes': 0, 'profiles': 0})
+
+    def test_stale_save_keeps_counters(self):
+        user, recipe = self.ctx['user'], self.ctx['recipe']
+        stale = Recipe.objects.get(pk=recipe)
+        author = get_user_model().objects.get(pk=self.ctx['author'])
+        profile = author.profile
+        self.client.force_authenticate(user)
+        for path in (f'/api/recipes/{recipe}/favorite/',
+                     f'/api/users/{author.pk}/subscribe/'):
+            self.assertEqual(self.client.post(path).status_code, 201)
+        # Объекты загружены до инкрементов и сохраняются целиком.
+        stale.save()
+        profile.save()
+        author.save()
+        self.assertEqual(
+            counters.recount(dry_run=True), {'recipes': 0, 'profiles': 0})
+
+    def test_repeated_writes_rejected_by_constraints(self):
+        recipe, author = self.ctx['recipe'], self.ctx['author']
+        self.client.force_authenticate(self.ctx['user'])
+        for path in (f'/api/recipes/{recipe}/favorite/',
+                     f'/api/recipes/{recipe}/shopping_cart/',
+                     f'/api/users/{author}/subscribe/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.post(path).status_code, 201)
+                self.assertEqual(self.client.post(path).status_code, 400)
+                self.assertEqual(self.client.delete(path).status_code, 204)
+                self.assertEqual(self.client.delete(path).status_code, 400)
+        self.assertEqual(
+            self.client.delete('/api/recipes/0/favorite/').status_code, 404)
+        self.assertEqual(
+            self.client.delete('/api/users/0/subscribe/').status_code, 404)
+        self.assertEqual(
+            counters.recount(dry_run=True), {'recipes': 0, 'profiles': 0})
+        self.assertEqual(shopping_list.rebuild(dry_run=True), {
+            'created': 0, 'updated': 0, 'deleted': 0})
+
+    def test_recount_repairs_drift(self):
+        Recipe.objects.update(favorites_count=0)
+        Favorite.objects.filter(user=self.ctx['user']).delete()
+        stale = counters.recount()
+        self.assertGreater(stale['recipes'], 0)
+        self.assertEqual(
+            counters.recount(dry_run=True), {'recipes': 0, 'profiles': 0})
+
+    def test_ordering_by_favorites_count(self):
+        results = self.client.get(
+            '/api/recipes/?ordering=-favorites_count&limit=20'
+        ).data['results']
+        expected = (
+            Recipe.objects.order_by('-favorites_count', '-id')
+            .values_list('id', flat=True)[:20]
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in results], list(expected))
+
+
+class RecipeFeedTests(APIBenchmarkMixin, TestCase):
+    client_class = APIClient
+    sizes = {'users': 1200, 'recipes': 3000, 'bench_subscriptions': 1100}
+
+    def test_feed_pages_follow_subscriptions(self):
+        user = self.ctx['user']
+        self.client.force_authenticate(user)
+        expected = list(
+            Recipe.objects.filter(author__subscribers__user=user)
+            .order_by('-id').values_list('id', flat=True)[:120]
+        )
+        self.assertEqual(len(expected), 120)
+        seen, url = [], '/api/recipes/feed/?limit=40'
+        while len(seen) < len(expected):
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            results = response.data['results']
+            self.assertTrue(all(
+                recipe['author']['is_subscribed'] for recipe in results))
+            seen += [recipe['id'] for recipe in results]
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+    def test_feed_ignores_ordering(self):
+        self.client.force_authenticate(self.ctx['user'])
+        pages = [
+            self.client.get(f'/api/recipes/feed/?limit=5{extra}').data
+            for extra in ('', '&ordering=-favorites_count')
+        ]
+        self.assertEqual(pages[0]['results'], pages[1]['results'])
+        cursors = [
+            parse_qs(urlparse(page['next']).query)['cursor']
+            for page in pages
+        ]
+        self.assertEqual(cursors[0], cursors[1])
+
+    def test_feed_requires_authentication(self):
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(RECIPE_LIST_CACHE_TIMEOUT=0)
+class AsyncReadPathTests(APIBenchmarkMixin, TestCase):
+    sizes = {'users': 100, 'recipes': 200}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.token = Token.objects.create(user=cls.ctx['user']).key
+
+    def paths(self):
+        return [
+            '/api/tags/',
+            '/api/ingredients/?name=%D1%81%D0%BE&limit=5',
+            '/api/recipes/?limit=6&offset=6',
+            f'/api/recipes/?tags={self.ctx["tag_slug"]}&is_favorited=1',
+            f'/api/recipes/{self.ctx["favorited"]}/',
+        ]
+
+    async def test_async_views_match_viewsets(self):
+        for headers in ({}, {'Authorization': f'Token {self.token}'}):
+            for path in self.paths():
+                with self.subTest(path=path, auth=bool(headers)):
+                    expected = await sync_to_async(self.client.get)(
+                        path, headers=headers)
+                    with override_settings(
+                            ROOT_URLCONF='foodgram.urls_async'):
+                        response = await self.async_client.get(
+                            path, headers=headers)
+                    self.assertEqual(response.status_code, 200)
+                    # Allow ставит только DRF — значит, ответил async view.
+                    self.assertNotIn('Allow', response)
+                    self.assertEqual(response.json(), expected.json())
+                    self.assertEqual(
+                        response.get('ETag'), expected.get('ETag'))
+
+    @override_settings(ROOT_URLCONF='foodgram.urls_async')
+    async def test_unsupported_requests_fall_back_to_viewsets(self):
+        for path in ('/api/recipes/?search=1', '/api/recipes/0/'):
+            response = await self.async_client.get(path)
+            self.assertIn('Allow', response)
+        response = await self.async_client.get(
+            '/api/recipes/', headers={'Authorization': 'Token wrong'})
+        self.assertEqual(response.status_code, 401)
+
+
+class RecipeWriteTests(TempMediaMixin, TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='cook', email='cook@example.org', password='x')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(4)
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Суп', image='recipes/images/x.png',
+            text='Варить', cooking_time=10)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=cls.recipe, ingredient=ing, amount=10)
+            for ing in cls.ingredients[:3]
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_update_applies_ingredient_diff(self):
+        kept = RecipeIngredient.objects.get(
+            recipe=self.recipe, ingredient=self.ingredients[0])
+        first, second, _, fourth = self.ingredients
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            {
+                'ingredients': [
+                    {'id': first.pk, 'amount': 10},
+                    {'id': second.pk, 'amount': 25},
+                    {'id': fourth.pk, 'amount': 5},
+                ],
+                'image': benchmark.IMAGE,
+                'name': 'Суп',
+                'text': 'Варить',
+                'cooking_time': 10,
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(RecipeIngredient.objects.filter(recipe=self.recipe)
+                 .values_list('ingredient_id', 'amount')),
+            {first.pk: 10, second.pk: 25, fourth.pk: 5}
+        )
+        self.assertTrue(
+            RecipeIngredient.objects.filter(pk=kept.pk).exists())
+
+    def test_unknown_ids_reported_together(self):
+        response = self.client.post(
+            '/api/recipes/',
+            {
+                'ingredients': [
+                    {'id': self.ingredients[0].pk, 'amount': 1},
+                    {'id': 9998, 'amount': 1},
+                    {'id': 9999, 'amount': 1},
+                ],
+                'tags': [9997],
+                'image': benchmark.IMAGE,
+                'name': 'Каша',
+                'text': 'Варить',
+                'cooking_time': 5,
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('9998, 9999', response.data['ingredients'][0])
+        self.assertIn('9997', response.data['tags'][0])
+
+    def recipe_payload(self, **extra):
+        return {
+            'ingredients': [{'id': self.ingredients[0].pk, 'amount': 1}],
+            'image': benchmark.IMAGE,
+            'name': 'Каша',
+            'text': 'Варить',
+            'cooking_time': 5,
+            **extra,
+        }
+
+    def test_image_variants_built_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/', self.recipe_payload(), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['image_variants'], {})
+        data = self.client.get(f'/api/recipes/{response.data["id"]}/').data
+        self.assertEqual(set(data['image_variants']), {'card', 'detail'})
+        self.assertTrue(data['image_variants']['card'].endswith('.webp'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(
+                '/api/users/me/avatar/', {'avatar': benchmark.IMAGE},
+                format='json')
+        avatar = self.client.get(f'/api/users/{self.user.pk}/').data['avatar']
+        self.assertTrue(avatar.endswith('.avatar.webp'))
+
+    def test_replaced_image_variants_deleted(self):
+        def variant_files(instance, field):
+            return [
+                name for variant, name in getattr(instance, field).items()
+                if variant != 'source'
+            ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/', self.recipe_payload(), format='json')
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        storage, source = recipe.image.storage, recipe.image.name
+        old = variant_files(recipe, 'image_variants')
+        self.assertTrue(old)
+        self.assertTrue(all(storage.exists(name) for name in old))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f'/api/recipes/{recipe.pk}/', self.recipe_payload(),
+                format='json')
+        recipe.refresh_from_db()
+        self.assertNotEqual(recipe.image.name, source)
+        self.assertFalse(any(storage.exists(name) for name in old))
+        self.assertTrue(all(
+            storage.exists(name)
+            for name in variant_files(recipe, 'image_variants')
+        ))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(
+                '/api/users/me/avatar/', {'avatar': benchmark.IMAGE},
+                format='json')
+        self.user.profile.refresh_from_db()
+        old = variant_files(self.user.profile, 'avatar_variants')
+        self.assertTrue(old)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/api/users/me/avatar/')
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.avatar_variants, {})
+        self.assertFalse(any(storage.exists(name) for name in old))
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=10)
+    def test_oversized_image_rejected_before_decoding(self):
+        response = self.client.post(
+            '/api/recipes/', self.recipe_payload(), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('10 байт', response.data['image'][0])
+
+
+class Base64ImageFieldTests(TestCase):
+
+    def setUp(self):
+        self.field = Base64ImageField()
+
+    def test_decode_in_chunks_skips_line_breaks(self):
+        raw = bytes(range(256)) * 10
+        encoded = base64.encodebytes(raw).decode()
+        buffer = io.BytesIO()
+        decode_base64(encoded, 0, buffer, chunk_size=8)
+        self.assertEqual(buffer.getvalue(), raw)
+
+    def test_bad_data_uri_rejected_before_decoding(self):
+        for data in ('data:image/svg+xml;base64,AAAA',
+                     'data:image/png,AAAA',
+                     'data:text/plain;base64,AAAA'):
+            with self.subTest(data=data), \
+                    self.assertRaises(ValidationError) as error:
+                self.field.to_internal_value(data)
+            self.assertEqual(
+                error.exception.detail[0].code, 'invalid_data_uri')
+
+    def test_broken_base64_rejected(self):
+        with self.assertRaises(ValidationError) as error:
+            self.field.to_internal_value('data:image/png;base64,AAA*')
+        self.assertEqual(error.exception.detail[0].code, 'invalid_image')
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=10)
+    def test_large_image_spooled_to_disk(self):
+        image = self.field.to_internal_value(benchmark.IMAGE)
+        self.assertTrue(hasattr(image, 'temporary_file_path'))
+        self.assertEqual(image.size, len(base64.b64decode(
+            benchmark.IMAGE.split(',', 1)[1])))
+
+
+@override_settings(
+    REQUEST_PROFILING=True,
+    REQUEST_PROFILING_SLOW_MS=10 ** 6,
+    REQUEST_PROFILING_SLOW_QUERIES=10 ** 6,
+    REQUEST_PROFILING_REPEATED_QUERIES=3
+)
+class RequestProfilingTests(TestCase):
+
+    def profile(self, view, path='/'):
+        request = RequestFactory().get(path)
+        return RequestProfilingMiddleware(view)(request)
+
+    def test_server_timing_counts_queries(self):
+        def view(request):
+            list(Tag.objects.all())
+            list(Ingredient.objects.all())
+            return HttpResponse()
+
+        response = self.profile(view)
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="2 SQL"$'
+        )
+
+    def test_repeated_queries_flagged(self):
+        def view(request):
+            for pk in range(4):
+                Tag.objects.filter(pk=pk).exists()
+            return HttpResponse()
+
+        with self.assertLogs('foodgram.profiling', 'WARNING') as logs:
+            self.profile(view)
+        self.assertIn('4 одинаковых запросов', logs.output[0])
+
+    @override_settings(REQUEST_PROFILING_SLOW_QUERIES=1)
+    def test_slow_request_logged_with_sql(self):
+        def view(request):
+            Tag.objects.exists()
+            return HttpResponse()
+
+        with self.assertLogs('foodgram.profiling', 'WARNING') as logs:
+            self.profile(view, '/api/tags/?x=1')
+        self.assertIn('/api/tags/?x=1', logs.output[0])
+        self.assertIn('recipes_tag', logs.output[0])
+
+    @override_settings(ROOT_URLCONF='foodgram.urls_async')
+    async def test_async_view_queries_counted(self):
+        # Тестовое соединение открыто до загрузки middleware, поэтому
+        # connection_created для него уже не придёт.
+        await sync_to_async(install_query_recorder)(connection=connection)
+        response = await self.async_client.get('/api/tags/')
+        self.assertIn('desc="2 SQL"', response['Server-Timing'])
+
+    @override_settings(REQUEST_PROFILING=False)
+    def test_disabled_middleware_is_skipped(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            RequestProfilingMiddleware(lambda request: HttpResponse())
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        overrides = override_settings(
+            METRICS_ENABLED=True, METRICS_DIR=tmp.name, METRICS_TOKEN='')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        metrics.reset()
+        self.admin = get_user_model().objects.create_user(
+            username='admin', email='admin@example.com',
+            is_staff=True)
+
+    def scrape(self, **headers):
+        client = APIClient()
+        if not headers:
+            client.force_authenticate(self.admin)
+        return client.get('/api/metrics/', headers=headers)
+
+    def test_latency_and_queries_per_action(self):
+        for _ in range(2):
+            self.client.get('/api/tags/')
+        text = self.scrape().content.decode()
+        labels = '{action="TagViewSet.list",method="GET"}'
+        self.assertIn(
+            f'foodgram_request_duration_seconds_count{labels} 2', text)
+        self.assertIn(f'foodgram_request_queries_count{labels} 2', text)
+        self.assertIn(
+            'foodgram_responses_total{action="TagViewSet.list",'
+            'method="GET",status="200"} 2', text)
+        self.assertIn(
+            'foodgram_request_duration_seconds_bucket'
+            '{action="TagViewSet.list",method="GET",le="+Inf"} 2', text)
+
+    def test_sql_text_kept_only_when_profiling(self):
+        profiles = []
+
+        def view(request):
+            profiles.append(current_profile.get())
+            Tag.objects.exists()
+            return HttpResponse()
+
+        for enabled in (False, True):
+            with override_settings(REQUEST_PROFILING=enabled):
+                MetricsMiddleware(view)(RequestFactory().get('/'))
+        without_sql, with_sql = profiles
+        self.assertEqual(without_sql.query_count, 1)
+        self.assertIsNone(without_sql.queries)
+        self.assertEqual(len(with_sql.queries), 1)
+
+    def test_workers_files_are_summed(self):
+        self.client.get('/api/tags/')
+        metrics.flush(force=True)
+        own = next(self.dir.glob('*.json'))
+        # Файл «другого воркера» с теми же значениями.
+        (self.dir / '1.json').write_text(own.read_text(encoding='utf-8'))
+        text = self.scrape().content.decode()
+        self.assertIn(
+            'foodgram_request_duration_seconds_count'
+            '{action="TagViewSet.list",method="GET"} 2', text)
+
+    def test_image_upload_sizes(self):
+        Base64ImageField().to_internal_value(benchmark.IMAGE)
+        text = self.scrape().content.decode()
+        self.assertIn('foodgram_image_upload_bytes_count{type="png"} 1', text)
+        self.assertIn('foodgram_recipe_list_cache_hit_ratio', text)
+
+    def test_access(self):
+        self.assertEqual(self.scrape(Authorization='').status_code, 401)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(
+                self.scrape(Authorization='Bearer wrong').status_code, 401)
+            self.assertEqual(
+                self.scrape(Authorization='Bearer secret').status_code, 200)
+
+
+class ShoppingListTests(TempMediaMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.author, cls.buyer, cls.other = (
+            User.objects.create_user(username=name, email=f'{name}@x.org')
+            for name in ('author', 'buyer', 'other')
+        )
+        cls.flour, cls.milk, cls.eggs = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('мука', 'молоко', 'яйца')
+        )
+        cls.pancakes, cls.omelette = Recipe.objects.bulk_create(
+            Recipe(author=cls.author, name=name, text='-', cooking_time=5,
+                   image='recipes/images/x.png',
+                   image_variants={'source': 'recipes/images/x.png'})
+            for name in ('Блины', 'Омлет')
+        )
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=cls.pancakes, ingredient=cls.flour, amount=100),
+            RecipeIngredient(
+                recipe=cls.pancakes, ingredient=cls.milk, amount=50),
+            RecipeIngredient(
+                recipe=cls.omelette, ingredient=cls.milk, amount=10),
+            RecipeIngredient(
+                recipe=cls.omelette, ingredient=cls.eggs, amount=3),
+        ])
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def shopping_list(self, user):
+        self.assertEqual(shopping_list.rebuild(dry_run=True), {
+            'created': 0, 'updated': 0, 'deleted': 0})
+        response = self.client_for(user).get('/api/recipes/shopping_list/')
+        return {item['name']: item['amount'] for item in response.json()}
+
+    def cart(self, user, recipe, method='post'):
+        response = getattr(self.client_for(user), method)(
+            f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.assertIn(response.status_code, (201, 204))
+
+    def test_incremental_updates(self):
+        self.cart(self.buyer, self.pancakes)
+        self.cart(self.buyer, self.omelette)
+        self.cart(self.other, self.pancakes)
+        self.assertEqual(
+            self.shopping_list(self.buyer),
+            {'мука': 100, 'молоко': 60, 'яйца': 3})
+
+        response = self.client_for(self.author).patch(
+            f'/api/recipes/{self.pancakes.pk}/',
+            {
+                'ingredients': [
+                    {'id': self.flour.pk, 'amount': 200},
+                    {'id': self.eggs.pk, 'amount': 2},
+                ],
+                'image': benchmark.IMAGE,
+                'name': 'Блины',
+                'text': '-',
+                'cooking_time': 5,
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.shopping_list(self.buyer),
+            {'мука': 200, 'молоко': 10, 'яйца': 5})
+        self.assertEqual(
+            self.shopping_list(self.other), {'мука': 200, 'яйца': 2})
+
+        self.cart(self.buyer, self.omelette, 'delete')
+        self.assertEqual(
+            self.shopping_list(self.buyer), {'мука': 200, 'яйца': 2})
+
+        self.pancakes.delete()
+        self.assertEqual(self.shopping_list(self.buyer), {})
+        self.assertEqual(self.shopping_list(self.other), {})
+
+    def test_rebuild_fixes_bypassed_changes(self):
+        self.cart(self.buyer, self.pancakes)
+        ShoppingCart.objects.create(user=self.buyer, recipe=self.omelette)
+        ShoppingCart.objects.filter(recipe=self.pancakes).delete()
+        self.assertEqual(
+            shopping_list.rebuild(dry_run=True),
+            {'created': 1, 'updated': 1, 'deleted': 1})
+        shopping_list.rebuild()
+        self.assertEqual(
+            self.shopping_list(self.buyer), {'молоко': 10, 'яйца': 3})
+        response = self.client_for(self.buyer).get(
+            '/api/recipes/download_shopping_cart/?format=json')
+        self.assertEqual(
+            json.loads(b''.join(response.streaming_content)),
+            [{'name': 'молоко', 'measurement_unit': 'г', 'amount': 10},
+             {'name': 'яйца', 'measurement_unit': 'г', 'amount': 3}])
+
+    def batch(self, user, path, method, recipes):
+        response = getattr(self.client_for(user), method)(
+            f'/api/recipes/{path}/', {'recipes': recipes}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return {item['id']: item['status'] for item in response.json()[
+            'results']}
+
+    def test_batch_cart(self):
+        self.cart(self.buyer, self.pancakes)
+        missing = self.omelette.pk + 100
+        ids = [self.pancakes.pk, self.omelette.pk, missing, self.omelette.pk]
+        self.assertEqual(
+            self.batch(self.buyer, 'shopping_cart', 'post', ids),
+            {self.pancakes.pk: 'exists', self.omelette.pk: 'created',
+             missing: 'not_found'})
+        self.assertEqual(
+            self.shopping_list(self.buyer),
+            {'мука': 100, 'молоко': 60, 'яйца': 3})
+        self.assertEqual(counters.recount(dry_run=True)['recipes'], 0)
+
+        self.assertEqual(
+            self.batch(self.buyer, 'shopping_cart', 'delete', ids),
+            {self.pancakes.pk: 'deleted', self.omelette.pk: 'deleted',
+             missing: 'not_found'})
+        self.assertEqual(self.shopping_list(self.buyer), {})
+        self.assertEqual(
+            self.batch(self.buyer, 'shopping_cart', 'delete', ids[:1]),
+            {self.pancakes.pk: 'missing'})
+        self.assertEqual(counters.recount(dry_run=True)['recipes'], 0)
+
+    def test_batch_cart_concurrent_change(self):
+        ids = [self.pancakes.pk, self.omelette.pk]
+        lookup = batch._lookup
+
+        def lookup_then(method):
+            # Одиночный запрос успевает между проверкой и записью пакета.
+            def wrapper(recipe_ids):
+                found = lookup(recipe_ids)
+                self.cart(self.buyer, self.pancakes, method)
+                return found
+            return mock.patch.object(batch, '_lookup', wrapper)
+
+        with lookup_then('post'):
+            self.assertEqual(
+                self.batch(self.buyer, 'shopping_cart', 'post', ids),
+                {self.pancakes.pk: 'exists', self.omelette.pk: 'created'})
+        self.assertEqual(
+            self.shopping_list(self.buyer),
+            {'мука': 100, 'молоко': 60, 'яйца': 3})
+        self.assertEqual(counters.recount(dry_run=True)['recipes'], 0)
+
+        with lookup_then('delete'):
+            self.assertEqual(
+                self.batch(self.buyer, 'shopping_cart', 'delete', ids),
+                {self.pancakes.pk: 'missing', self.omelette.pk: 'deleted'})
+        self.assertEqual(self.shopping_list(self.buyer), {})
+        self.assertEqual(counters.recount(dry_run=True)['recipes'], 0)
+
+    def test_batch_favorites(self):
+        ids = [self.pancakes.pk, self.omelette.pk]
+        self.assertEqual(
+            self.batch(self.buyer, 'favorite', 'post', ids),
+            dict.fromkeys(ids, 'created'))
+        self.assertEqual(
+            self.batch(self.other, 'favorite', 'post', ids[:1]),
+            {self.pancakes.pk: 'created'})
+        self.assertEqual(
+            Recipe.objects.get(pk=self.pancakes.pk).favorites_count, 2)
+        self.assertEqual(
+            self.batch(self.buyer, 'favorite', 'delete', ids),
+            dict.fromkeys(ids, 'deleted'))
+        self.assertEqual(counters.recount(dry_run=True)['recipes'], 0)
+        self.assertEqual(
+            Favorite.objects.filter(user=self.other).count(), 1)
+
+        client = self.client_for(self.buyer)
+        for recipes in ([], ['x'], list(range(1, 102))):
+            response = client.post(
+                '/api/recipes/favorite/', {'recipes': recipes}, format='json')
+            self.assertEqual(response.status_code, 400, recipes)
+
+    def download_pdf(self, user):
+        return self.client_for(user).get(
+            '/api/recipes/download_shopping_cart/?format=pdf')
+
+    def test_pdf_cached_by_contents(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        cache_dir = Path(tmp.name)
+        self.cart(self.buyer, self.pancakes)
+        self.cart(self.other, self.pancakes)
+        with override_settings(
+                SHOPPING_LIST_PDF_DIR=tmp.name, SHOPPING_LIST_PDF_WORKERS=1):
+            response = self.download_pdf(self.buyer)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+            self.assertTrue(b''.join(response.streaming_content).startswith(
+                b'%PDF'))
+            files = list(cache_dir.glob('*.pdf'))
+            self.assertEqual(len(files), 1)
+
+            # Тот же список — тот же файл, без новой сборки.
+            with mock.patch.object(pdf, 'build') as build:
+                self.assertEqual(
+                    self.download_pdf(self.other).status_code, 200)
+            build.assert_not_called()
+
+            self.cart(self.buyer, self.omelette)
+            self.assertEqual(self.download_pdf(self.buyer).status_code, 200)
+            self.assertEqual(len(list(cache_dir.glob('*.pdf'))), 2)
+
+    def test_pdf_cache_pruned_over_limit(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        cache_dir = Path(tmp.name)
+        with override_settings(
+                SHOPPING_LIST_PDF_DIR=tmp.name, SHOPPING_LIST_PDF_WORKERS=0,
+                SHOPPING_LIST_PDF_MAX_FILES=2):
+            self.assertEqual(self.download_pdf(self.buyer).status_code, 200)
+            self.cart(self.buyer, self.pancakes)
+            self.assertEqual(self.download_pdf(self.buyer).status_code, 200)
+            self.assertEqual(len(list(cache_dir.glob('*.pdf'))), 2)
+            self.cart(self.buyer, self.omelette)
+            # Третий файл превышает лимит: остаётся только самый свежий.
+            with mock.patch.object(
+                    pdf, 'prune', wraps=pdf.prune) as prune:
+                self.assertEqual(
+                    self.download_pdf(self.buyer).status_code, 200)
+            prune.assert_called_once()
+            [kept] = cache_dir.glob('*.pdf')
+
+            # Удалённый из кэша файл — промах, а не ошибка.
+            kept.unlink()
+            response = self.download_pdf(self.buyer)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(b''.join(response.streaming_content).startswith(
+                b'%PDF'))
+
+    def test_pdf_build_error(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for workers in (0, 1):
+            with self.subTest(workers=workers), override_settings(
+                    SHOPPING_LIST_PDF_DIR=tmp.name,
+                    SHOPPING_LIST_PDF_WORKERS=workers, SHOPPING_LIST_PDF_WAIT=5
+            ), mock.patch.object(pdf, 'render_pages', side_effect=OSError), \
+                    self.assertLogs('recipes.pdf', 'ERROR'):
+                response = self.download_pdf(self.buyer)
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response['Retry-After'], '1')
+
+    def test_pdf_not_ready(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cart(self.buyer, self.pancakes)
+        started, release = threading.Event(), threading.Event()
+        build = pdf.build
+
+        def slow_build(rows, path):
+            started.set()
+            release.wait(5)
+            build(rows, path)
+
+        with override_settings(
+                SHOPPING_LIST_PDF_DIR=tmp.name, SHOPPING_LIST_PDF_WORKERS=1,
+                SHOPPING_LIST_PDF_WAIT=0):
+            with mock.patch.object(pdf, 'build', slow_build):
+                response = self.download_pdf(self.buyer)
+                self.assertEqual(response.status_code, 202)
+                self.assertEqual(response['Retry-After'], '1')
+                self.assertTrue(started.wait(5))
+                release.set()
+                with override_settings(SHOPPING_LIST_PDF_WAIT=5):
+                    response = self.download_pdf(self.buyer)
+            self.assertEqual(response.status_code, 200)
+
+
+@override_settings(RECIPE_LIST_CACHE_TIMEOUT=0)
+class RecipeSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user(
+            username='cook', email='cook@example.org')
+        cls.potato, cls.salt = Ingredient.objects.bulk_create([
+            Ingredient(name='картофель', measurement_unit='г'),
+            Ingredient(name='соль', measurement_unit='г'),
+        ])
+        cls.mash, cls.soup, cls.salad = Recipe.objects.bulk_create(
+            # Миниатюры «уже построены»: картинки в хранилище нет.
+            Recipe(author=author, name=name, text=text, cooking_time=10,
+                   image='recipes/images/x.png',
+                   image_variants={'source': 'recipes/images/x.png'})
+            for name, text in (
+                ('Картофельное пюре', 'Размять'),
+                ('Суп', 'Положить картофель'),
+                ('Салат', 'Нарезать'),
+            )
+        )
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=cls.mash, ingredient=cls.salt, amount=1),
+            RecipeIngredient(recipe=cls.soup, ingredient=cls.salt, amount=1),
+            RecipeIngredient(
+                recipe=cls.salad, ingredient=cls.potato, amount=1),
+        ])
+        search.reindex()
+
+    def found(self, term):
+        response = self.client.get('/api/recipes/', {'search': term})
+        return [recipe['name'] for recipe in response.json()['results']]
+
+    def test_ranked_by_name_ingredients_text(self):
+        self.assertEqual(
+            self.found('картоф'), ['Картофельное пюре', 'Салат', 'Суп'])
+
+    def test_all_words_required(self):
+        self.assertEqual(self.found('суп картофель'), ['Суп'])
+        self.assertEqual(self.found('суп соль'), ['Суп'])
+        self.assertEqual(self.found('борщ'), [])
+
+    def test_index_follows_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salt.name = 'перец'
+            self.salt.save()
+            self.salad.name = 'Винегрет'
+            self.salad.save()
+        self.assertEqual(self.found('перец'), ['Суп', 'Картофельное пюре'])
+        self.assertEqual(self.found('салат'), [])
+        self.assertEqual(self.found('винегрет'), ['Винегрет'])
+        soup_id = self.soup.pk
+        self.soup.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM {search.FTS_TABLE} WHERE rowid = %s',
+                [soup_id])
+            self.assertEqual(cursor.fetchone(), (0,))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'План запроса в формате SQLite')
+class IndexUsageTests(TestCase):
+    """Составные индексы из 0009_composite_indexes попадают в планы."""
+
+    def index_on(self, table, columns):
+        """Имя индекса по столбцам: у UniqueConstraint оно автоматическое."""
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA index_list({table})')
+            for row in cursor.fetchall():
+                cursor.execute(f'PRAGMA index_info({row[1]})')
+                if [info[2] for info in cursor.fetchall()] == columns:
+                    return row[1]
+        self.fail(f'Нет индекса {table}{tuple(columns)}')
+
+    def assertUsesIndex(self, queryset, table, columns):
+        self.assertIn(
+            f'INDEX {self.index_on(table, columns)} (', queryset.explain())
+
+    def test_user_flags_use_user_recipe_indexes(self):
+        user = get_user_model()(pk=1)
+        plan = Recipe.objects.with_user_flags(user).explain()
+        for table, columns in (
+            ('recipes_favorite', ['user_id', 'recipe_id']),
+            ('recipes_shoppingcart', ['user_id', 'recipe_id']),
+            ('users_subscription', ['user_id', 'author_id']),
+        ):
+            with self.subTest(table=table):
+                self.assertIn(self.index_on(table, columns), plan)
+
+    def test_lookups_by_recipe_use_recipe_user_indexes(self):
+        for model in (Favorite, ShoppingCart):
+            with self.subTest(model=model.__name__):
+                self.assertUsesIndex(
+                    model.objects.filter(recipe_id=1),
+                    model._meta.db_table, ['recipe_id', 'user_id'])
+
+    def test_author_recipes_use_author_id_index(self):
+        self.assertUsesIndex(
+            Recipe.objects.filter(author_id=1).order_by('-id')[:3],
+            'recipes_recipe', ['author_id', 'id'])
+
+    def test_tag_filter_uses_tag_recipe_index(self):
+        self.assertUsesIndex(
+            Recipe.objects.filter(tags__slug='breakfast'),
+            'recipes_recipe_tags', ['tag_id', 'recipe_id'])
+
+    def test_subscribers_use_author_user_index(self):
+        self.assertUsesIndex(
+            Subscription.objects.filter(author_id=1),
+            'users_subscription', ['author_id', 'user_id'])
+
+
+class IngredientImportTests(TestCase):
+
+    def test_read_json_across_chunk_boundaries(self):
+        items = [{'name': f'соль {i}', 'measurement_unit': 'г'}
+                 for i in range(50)]
+        data = json.dumps(items, ensure_ascii=False, indent=1)
+        self.assertEqual(
+            list(read_json(io.StringIO(data), chunk_size=7)),
+            [(item['name'], item['measurement_unit']) for item in items]
+        )
+
+    def test_import_skips_existing_and_duplicates(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        rows = read_csv(io.StringIO(
+            'name,measurement_unit\nсоль,г\nсахар,г\n сахар ,г\nмука,\n'
+        ))
+        stats = import_ingredients(rows, batch_size=1)
+        self.assertEqual((stats.read, stats.created), (4, 1))
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+    def test_created_counts_only_inserted_rows(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        # Пара появилась после чтения загруженных: её отсекает только
+        # ignore_conflicts, и созданной она считаться не должна.
+        loaded = mock.MagicMock()
+        loaded.iterator.return_value = iter(())
+        with mock.patch.object(
+                Ingredient.objects, 'values_list', return_value=loaded):
+            stats = import_ingredients([('соль', 'г'), ('сахар', 'г')])
+        self.assertEqual((stats.read, stats.created, stats.skipped), (2, 1, 1))
+
+    def test_dry_run_writes_nothing(self):
+        stats = import_ingredients([('соль', 'г')], dry_run=True)
+        self.assertEqual(stats.created, 1)
+        self.assertFalse(Ingredient.objects.exists())
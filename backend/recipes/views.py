@@ -1,10 +1,14 @@
-from django.http import HttpResponse
 import django_filters
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import prefetch_related_objects
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.pagination import LimitOffsetPagination
-from rest_framework import filters, mixins, status, viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.negotiation import DefaultContentNegotiation
 from rest_framework.permissions import (
+    IsAdminUser,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly
 )
@@ -12,17 +16,56 @@ from rest_framework.permissions import (
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework import serializers
-from .filters import RecipeFilter
-from .models import Ingredient, Tag, Recipe, Favorite, ShoppingCart
+from . import batch, counters, list_cache, shopping_list
+from .autocomplete import ingredient_index
+from .conditional import (
+    VersionedListMixin,
+    conditional_response,
+    get_version,
+    recipe_etag,
+    set_validators
+)
+from .filters import RecipeFilter, RecipeOrderingFilter, RecipeSearchFilter
+from .pagination import RecipeCursorPagination, RecipeFeedPagination
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    ShoppingCart,
+    Tag,
+    ingredients_prefetch
+)
 from .serializers import (
     IngredientSerializer,
     TagSerializer,
+    RecipeIdsSerializer,
     RecipeReadSerializer,
     RecipeWriteSerializer,
-    ShoppingCartSerializer
+    ShoppingCartSerializer,
+    ShoppingListItemSerializer
 )
 
 
+class ShoppingListNegotiation(DefaultContentNegotiation):
+    """
+    ?format= выбирает формат файла списка покупок, а не рендерер DRF.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+def download_shopping_list(request):
+    fmt = request.query_params.get('format', 'txt')
+    if fmt not in shopping_list.FORMATS:
+        return Response(
+            {'format': f'Допустимые форматы: '
+                       f'{", ".join(shopping_list.FORMATS)}.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return shopping_list.shopping_list_response(request.user, fmt)
+
+
 class IngredientFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(
         field_name='name',
@@ -34,17 +77,38 @@ class IngredientFilter(django_filters.FilterSet):
         fields = ['name']
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(VersionedListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = {'name': ['istartswith']}
     filterset_class = IngredientFilter
+    version_resource = 'ingredients'
 
+    def get_limit(self):
+        limit = self.request.query_params.get('limit', '')
+        return int(limit) if limit.isdigit() and int(limit) > 0 else None
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    def list_response(self, request, *args, **kwargs):
+        """
+        ?name= — автодополнение по префиксу из индекса в памяти,
+        ?limit= ограничивает число подсказок.
+        """
+        name = request.query_params.get('name')
+        limit = self.get_limit()
+        if name and settings.INGREDIENT_AUTOCOMPLETE_IN_MEMORY:
+            return Response(ingredient_index.search(
+                name, limit, version=self.resource_version))
+        queryset = self.filter_queryset(self.get_queryset())
+        if limit is not None:
+            queryset = queryset[:limit]
+        return Response(self.get_serializer(queryset, many=True).data)
+
+
+class TagViewSet(VersionedListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    version_resource = 'tags'
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -52,43 +116,142 @@ class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly]
     pagination_class = LimitOffsetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [
+        DjangoFilterBackend,
+        RecipeSearchFilter,
+        RecipeOrderingFilter
+    ]
     filterset_class = RecipeFilter
-    search_fields = ['name', 'author__username']
+    ordering_fields = ['favorites_count', 'carts_count']
+    # Удаление из избранного и корзины фильтрует по pk из адреса
+    # без get_object().
+    lookup_value_regex = r'\d+'
+
+    @property
+    def paginator(self):
+        """
+        ?cursor= включает keyset-пагинацию вместо limit/offset
+        для бесконечной ленты; у ленты подписок она всегда своя.
+        """
+        if not hasattr(self, '_paginator'):
+            if self.action == 'feed':
+                self._paginator = RecipeFeedPagination()
+            elif 'cursor' in self.request.query_params:
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
-    
         queryset = super().get_queryset()
-        user = self.request.user
-        if user.is_authenticated:
-            # Фильтр избранного
-            fav = self.request.query_params.get('is_favorited')
-            if fav in ('true', 'True', '1'):
-                queryset = queryset.filter(favorited_by__user=user)
-            # Фильтр корзины
-            cart = self.request.query_params.get('is_in_shopping_cart')
-            if cart in ('true', 'True', '1'):
-                queryset = queryset.filter(in_shopping_carts__user=user)
+        if self.action == 'feed':
+            # Один JOIN с подписками: подписка уникальна по (user,
+            # author), поэтому рецепты не дублируются.
+            queryset = queryset.filter(
+                author__subscribers__user=self.request.user)
+        if self.action in ('list', 'feed'):
+            queryset = queryset.with_related()
+        elif self.action == 'retrieve':
+            # Ингредиенты подгружаются в retrieve после проверки ETag.
+            queryset = queryset.with_author()
+        if self.action in ('list', 'retrieve', 'feed'):
+            queryset = queryset.with_user_flags(self.request.user)
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        """Анонимные списки отдаются из кэша (см. list_cache)."""
+        key = None
+        if request.user.is_anonymous and list_cache.is_enabled():
+            key = list_cache.make_key(request)
+        if key is not None:
+            data = list_cache.lookup(key)
+            if data is not None:
+                return Response(data, headers={'X-Cache': 'HIT'})
+        response = super().list(request, *args, **kwargs)
+        if key is not None and response.status_code == 200:
+            list_cache.store(key, response.data)
+            response['X-Cache'] = 'MISS'
+        return response
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated]
+    )
+    def feed(self, request):
+        """
+        GET /api/recipes/feed/?cursor=&limit=
+        Рецепты авторов, на которых подписан пользователь, новые сверху,
+        с теми же полями, что и список. Всегда keyset-пагинация по -id:
+        страница — один запрос к рецептам с JOIN подписок и условием
+        id < курсора, сколько бы авторов ни было в подписках.
+        """
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAdminUser],
+        url_path='cache-stats'
+    )
+    def cache_stats(self, request):
+        """Счётчики попаданий и промахов кэша анонимных списков."""
+        return Response(list_cache.stats())
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        ETag строится из строки рецепта с аннотациями пользователя,
+        автора и версии ингредиентов; при совпадении If-None-Match — 304.
+        Last-Modified не отдаём: флаги избранного и корзины меняются
+        без изменения updated_at.
+        """
+        recipe = self.get_object()
+        etag = recipe_etag(recipe, get_version('ingredients').version)
+        vary = ('Authorization',)
+        not_modified = conditional_response(request, etag)
+        if not_modified is not None:
+            return set_validators(not_modified, etag, vary=vary)
+        prefetch_related_objects([recipe], ingredients_prefetch())
+        response = Response(self.get_serializer(recipe).data)
+        return set_validators(response, etag, vary=vary)
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'feed'):
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        counters.change_profile_counter(
+            self.request.user.pk, 'recipes_count', 1)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        author_id = instance.author_id
+        instance.delete()
+        counters.change_profile_counter(author_id, 'recipes_count', -1)
+
+    def get_read_data(self, recipe):
+        """Ответ на запись: рецепт перечитывается аннотированным запросом."""
+        recipe = Recipe.objects.with_related().with_user_flags(
+            self.request.user
+        ).get(pk=recipe.pk)
+        return RecipeReadSerializer(
+            recipe, context=self.get_serializer_context()
+        ).data
 
     def create(self, request, *args, **kwargs):
         ser = self.get_serializer(data=request.data)
         ser.is_valid(raise_exception=True)
         self.perform_create(ser)
-        out = RecipeReadSerializer(ser.instance, context={'request': request})
+        data = self.get_read_data(ser.instance)
         return Response(
-            out.data,
+            data,
             status=status.HTTP_201_CREATED,
-            headers=self.get_success_headers(out.data)
+            headers=self.get_success_headers(data)
         )
 
     def update(self, request, *args, **kwargs):
@@ -99,8 +262,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         ser = self.get_serializer(recipe, data=request.data, partial=partial)
         ser.is_valid(raise_exception=True)
         self.perform_update(ser)
-        out = RecipeReadSerializer(ser.instance, context={'request': request})
-        return Response(out.data)
+        return Response(self.get_read_data(ser.instance))
 
     def destroy(self, request, *args, **kwargs):
         recipe = self.get_object()
@@ -110,73 +272,142 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
+        """
+        Вставка без предварительной проверки: повтор (в том числе
+        одновременный двойной клик) отсекает уникальное ограничение.
+        """
         recipe = self.get_object()
-        if Favorite.objects.filter(user=request.user, recipe=recipe).exists():
+        try:
+            with transaction.atomic():
+                Favorite.objects.create(user=request.user, recipe=recipe)
+                counters.change_recipe_counter(
+                    recipe.pk, 'favorites_count', 1)
+        except IntegrityError:
             return Response(
                 {'errors': 'Рецепт уже в избранном!'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        Favorite.objects.create(user=request.user, recipe=recipe)
         data = RecipeSimpleSerializer(
             recipe, context={'request': request}).data
         return Response(data, status=status.HTTP_201_CREATED)
 
+    def not_listed_response(self, errors):
+        """400, если рецепт есть, но не в списке; иначе 404."""
+        self.get_object()
+        return Response(
+            {'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
     @favorite.mapping.delete
     def delete_favorite(self, request, pk=None):
-        recipe = self.get_object()
-        qs = Favorite.objects.filter(user=request.user, recipe=recipe)
-        if qs.exists():
-            qs.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(
-            {'errors': 'Рецепт не в избранном!'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+        """Число удалённых строк решает между 204 и 400."""
+        with transaction.atomic():
+            deleted, _ = Favorite.objects.filter(
+                user=request.user, recipe_id=pk).delete()
+            if deleted:
+                counters.change_recipe_counter(
+                    pk, 'favorites_count', -deleted)
+        if not deleted:
+            return self.not_listed_response('Рецепт не в избранном!')
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, pk=None):
         recipe = self.get_object()
-        if ShoppingCart.objects.filter(user=request.user, recipe=recipe).exists():
+        try:
+            with transaction.atomic():
+                ShoppingCart.objects.create(user=request.user, recipe=recipe)
+                counters.change_recipe_counter(recipe.pk, 'carts_count', 1)
+                shopping_list.add_recipe(recipe.pk, request.user.pk)
+        except IntegrityError:
             return Response(
                 {'errors': 'Рецепт уже в корзине!'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        ShoppingCart.objects.create(user=request.user, recipe=recipe)
-        data = RecipeSimpleSerializer(recipe, context={'request': request}).data
+        data = RecipeSimpleSerializer(
+            recipe, context={'request': request}).data
         return Response(data, status=status.HTTP_201_CREATED)
 
     @shopping_cart.mapping.delete
     def delete_shopping_cart(self, request, pk=None):
-        recipe = self.get_object()
-        qs = ShoppingCart.objects.filter(user=request.user, recipe=recipe)
-        if qs.exists():
-            qs.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(
-            {'errors': 'Рецепт не в корзине!'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-
-    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated], url_path='download_shopping_cart')
+        with transaction.atomic():
+            deleted, _ = ShoppingCart.objects.filter(
+                user=request.user, recipe_id=pk).delete()
+            if deleted:
+                counters.change_recipe_counter(pk, 'carts_count', -deleted)
+                shopping_list.remove_recipe(pk, request.user.pk)
+        if not deleted:
+            return self.not_listed_response('Рецепт не в корзине!')
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def batch_response(self, request, change, model):
+        ser = RecipeIdsSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        results = change(model, request.user, ser.validated_data['recipes'])
+        return Response({'results': results})
+
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=[IsAuthenticated],
+        url_path='favorite',
+        url_name='favorite-batch'
+    )
+    def favorite_batch(self, request):
+        """
+        POST /api/recipes/favorite/ {"recipes": [id, ...]}
+        Добавляет рецепты в избранное, статус — по каждому id.
+        """
+        return self.batch_response(request, batch.add, Favorite)
+
+    @favorite_batch.mapping.delete
+    def delete_favorite_batch(self, request):
+        return self.batch_response(request, batch.remove, Favorite)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart',
+        url_name='shopping-cart-batch'
+    )
+    def shopping_cart_batch(self, request):
+        """
+        POST /api/recipes/shopping_cart/ {"recipes": [id, ...]}
+        Добавляет рецепты в корзину, статус — по каждому id.
+        """
+        return self.batch_response(request, batch.add, ShoppingCart)
+
+    @shopping_cart_batch.mapping.delete
+    def delete_shopping_cart_batch(self, request):
+        return self.batch_response(request, batch.remove, ShoppingCart)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+        url_path='download_shopping_cart',
+        content_negotiation_class=ShoppingListNegotiation
+    )
     def download_shopping_cart(self, request):
         """
-        GET /api/recipes/download_shopping_cart/
-        Текстовый список ингредиентов по всем рецептам в корзине.
+        GET /api/recipes/download_shopping_cart/?format=txt|csv|json
+        Список ингредиентов по всем рецептам в корзине.
         """
-        ingredients = {}
-        recipes = Recipe.objects.filter(in_shopping_carts__user=request.user)
-        for rec in recipes:
-            for ri in rec.recipeingredient_set.all():
-                key = (ri.ingredient.name, ri.ingredient.measurement_unit)
-                ingredients[key] = ingredients.get(key, 0) + ri.amount
+        return download_shopping_list(request)
 
-        lines = [
-            f"{name} ({unit}) — {amt}" for (name, unit),
-            amt in ingredients.items()]
-        content = "\n".join(lines)
-        resp = HttpResponse(content, content_type='text/plain')
-        resp['Content-Disposition'] = 'attachment; filename="shopping_list.txt"'
-        return resp
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_list'
+    )
+    def shopping_list(self, request):
+        """
+        GET /api/recipes/shopping_list/
+        Список покупок в JSON: ингредиенты корзины с суммами.
+        """
+        items = shopping_list.list_items(request.user)
+        return Response(ShoppingListItemSerializer(items, many=True).data)
 
     @action(detail=True, methods=['get'],
             permission_classes=[IsAuthenticatedOrReadOnly], url_path='get-link')
@@ -195,33 +426,25 @@ class ShoppingCartViewSet(mixins.CreateModelMixin,
     def get_queryset(self):
         return ShoppingCart.objects.filter(user=self.request.user)
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
-
-    @action(detail=False, methods=['get'])
+        cart = serializer.save(user=self.request.user)
+        counters.change_recipe_counter(cart.recipe_id, 'carts_count', 1)
+        shopping_list.add_recipe(cart.recipe_id, cart.user_id)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        counters.change_recipe_counter(instance.recipe_id, 'carts_count', -1)
+        shopping_list.remove_recipe(instance.recipe_id, instance.user_id)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        content_negotiation_class=ShoppingListNegotiation
+    )
     def download(self, request):
-        ingredients = {}
-        recipes = Recipe.objects.filter(
-            in_shopping_carts__user=request.user
-        )
-        for recipe in recipes:
-            for ri in recipe.recipeingredient_set.all():
-                key = (
-                    ri.ingredient.name,
-                    ri.ingredient.measurement_unit
-                )
-                ingredients[key] = ingredients.get(key, 0) + ri.amount
-
-        lines = [
-            f"{name} ({unit}) — {amt}"
-            for (name, unit), amt in ingredients.items()
-        ]
-        content = "\n".join(lines)
-        response = HttpResponse(content, content_type='text/plain')
-        response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
-        )
-        return response
+        return download_shopping_list(request)
 
 
 class RecipeSimpleSerializer(serializers.ModelSerializer):
@@ -6,19 +6,55 @@ from django.dispatch import receiver
 User = settings.AUTH_USER_MODEL
 
 
+class CountersModelMixin:
+    """
+    save() существующей строки не пишет поля COUNTER_FIELDS: их меняет
+    только recipes/counters.py через UPDATE ... F(), и значения,
+    прочитанные при загрузке объекта, затёрли бы чужие инкременты.
+    """
+    COUNTER_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Отложенные поля Django и сам не пишет.
+            skipped = {*self.COUNTER_FIELDS, *self.get_deferred_fields()}
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
+
 class Subscription(models.Model):
 
+    # Оба поля — префиксы составных индексов из Meta.
     user = models.ForeignKey(
-        User, related_name='subscriptions', on_delete=models.CASCADE)
+        User, related_name='subscriptions', on_delete=models.CASCADE,
+        db_index=False)
 
     author = models.ForeignKey(
-        User, related_name='subscribers', on_delete=models.CASCADE)
+        User, related_name='subscribers', on_delete=models.CASCADE,
+        db_index=False)
 
     class Meta:
-        unique_together = ('user', 'author')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_subscription_user_author'
+            )
+        ]
+        indexes = [
+            # Подписчики автора и их число.
+            models.Index(
+                fields=['author', 'user'],
+                name='subscription_author_user_idx'
+            ),
+        ]
+
 
+class Profile(CountersModelMixin, models.Model):
+    COUNTER_FIELDS = ('recipes_count', 'subscribers_count')
 
-class Profile(models.Model):
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -29,6 +65,21 @@ class Profile(models.Model):
         null=True,
         blank=True
     )
+    # Миниатюры WebP, см. recipes/images.py.
+    avatar_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False
+    )
+    # Денормализованные счётчики, см. recipes/counters.py.
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False
+    )
 
     def __str__(self):
         return f"{self.user.username} Profile"
@@ -1,6 +1,7 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
+from recipes.images import variant_urls
 from .models import Subscription
 
 User = get_user_model()
@@ -63,19 +64,31 @@ class CustomUserSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return Subscription.objects.filter(
             user=request.user, author=obj
         ).exists()
 
     def get_avatar(self, obj):
+        """Миниатюра аватара, если она уже построена, иначе оригинал."""
         request = self.context.get('request')
-        avatar = getattr(getattr(obj, 'profile', None), 'avatar', None)
+        profile = getattr(obj, 'profile', None)
+        avatar = getattr(profile, 'avatar', None)
         if not avatar or not avatar.name:
             return None
+        variants = variant_urls(avatar, profile.avatar_variants, request)
+        if 'avatar' in variants:
+            return variants['avatar']
         url = avatar.url
         return request.build_absolute_uri(url) if request else url
 
 
+def get_recipes_limit(request):
+    limit = request.query_params.get('recipes_limit') if request else None
+    return int(limit) if limit and limit.isdigit() else None
+
+
 class SubscriptionSerializer(CustomUserSerializer):
 
     recipes = serializers.SerializerMethodField()
@@ -88,14 +101,18 @@ class SubscriptionSerializer(CustomUserSerializer):
 
     def get_recipes(self, author):
         from recipes.serializers import RecipeSimpleSerializer
-        request = self.context.get('request')
-        limit = request.query_params.get('recipes_limit')
-        qs = author.recipes.all()
-        if limit and limit.isdigit():
-            qs = qs[: int(limit)]
+        # recipes_preview — Prefetch с окном по автору из UserViewSet.
+        qs = getattr(author, 'recipes_preview', None)
+        if qs is None:
+            qs = author.recipes.all()
+            limit = get_recipes_limit(self.context.get('request'))
+            if limit is not None:
+                qs = qs[:limit]
         return RecipeSimpleSerializer(
             qs, many=True, context=self.context
         ).data
 
     def get_recipes_count(self, author):
+        if hasattr(author, 'recipes_count'):
+            return author.recipes_count
         return author.recipes.count()
@@ -1,3 +1,35 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from recipes.models import Recipe
+from recipes.tests import APIBenchmarkMixin
+from users.models import Subscription
+
+
+class UserEndpointsBenchmarkTests(APIBenchmarkMixin, TestCase):
+    group = 'users'
+    client_class = APIClient
+
+    def test_subscriptions_recipe_previews(self):
+        user = self.ctx['user']
+        self.client.force_authenticate(user)
+        for limit in (6, 50):
+            with self.assertNumQueries(3):
+                response = self.client.get(
+                    f'/api/users/subscriptions/?limit={limit}'
+                    f'&recipes_limit=2'
+                )
+        results = response.json()['results']
+        self.assertEqual(
+            len(results),
+            Subscription.objects.filter(user=user).count()
+        )
+        for author in results:
+            recipes = Recipe.objects.filter(author_id=author['id'])
+            self.assertEqual(author['recipes_count'], recipes.count())
+            self.assertEqual(
+                [recipe['id'] for recipe in author['recipes']],
+                list(recipes.order_by('-id')
+                     .values_list('id', flat=True)[:2])
+            )
+            self.assertTrue(author['is_subscribed'])
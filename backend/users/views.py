@@ -1,16 +1,29 @@
 from django.contrib.auth import get_user_model
+from django.db.models import (
+    BooleanField,
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Value
+)
+from django.db.models.functions import Coalesce
+from django.db import IntegrityError, transaction
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import serializers
+from recipes import counters
 from recipes.fields import Base64ImageField
+from recipes.models import Recipe
 from .models import Subscription, Profile
 from .pagination import CustomLimitOffsetPagination
 from .serializers import (
     CustomUserCreateSerializer,
     CustomUserSerializer,
-    SubscriptionSerializer
+    SubscriptionSerializer,
+    get_recipes_limit
 )
 
 User = get_user_model()
@@ -29,12 +42,54 @@ class UserViewSet(viewsets.ModelViewSet):
 
     queryset = User.objects.all()
     pagination_class = CustomLimitOffsetPagination
+    # unsubscribe фильтрует по pk из адреса без get_object().
+    lookup_value_regex = r'\d+'
 
     def get_permissions(self):
         if self.action in ('list', 'retrieve', 'create'):
             return [AllowAny()]
         return [IsAuthenticated()]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.select_related('profile').annotate(
+                is_subscribed=self.is_subscribed_expression()
+            )
+        return queryset
+
+    def is_subscribed_expression(self):
+        user = self.request.user
+        if user.is_anonymous:
+            return Value(False, output_field=BooleanField())
+        return Exists(Subscription.objects.filter(
+            user=user, author=OuterRef('pk')))
+
+    def get_subscriptions_queryset(self):
+        """
+        Авторы, на которых подписан пользователь: профиль, число рецептов
+        (денормализованный Profile.recipes_count) и первые recipes_limit
+        рецептов каждого автора — одним запросом на всю страницу
+        (Prefetch со срезом — ROW_NUMBER() по автору).
+        """
+        recipes = Recipe.objects.order_by('-id')
+        limit = get_recipes_limit(self.request)
+        if limit is not None:
+            recipes = recipes[:limit]
+        return (
+            User.objects
+            .filter(subscribers__user=self.request.user)
+            .select_related('profile')
+            .annotate(
+                recipes_count=Coalesce(F('profile__recipes_count'), 0),
+                is_subscribed=Value(True, output_field=BooleanField())
+            )
+            .prefetch_related(Prefetch(
+                'recipes', queryset=recipes, to_attr='recipes_preview'
+            ))
+            .order_by('id')
+        )
+
     def get_serializer_class(self):
         if self.action == 'create':
             return CustomUserCreateSerializer
@@ -60,14 +115,20 @@ class UserViewSet(viewsets.ModelViewSet):
                 {'errors': 'Нельзя подписаться на себя!'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        if Subscription.objects.filter(user=user, author=author).exists():
+        # Повтор, в том числе одновременный, отсекает уникальное
+        # ограничение — без предварительной проверки exists().
+        try:
+            with transaction.atomic():
+                Subscription.objects.create(user=user, author=author)
+                counters.change_profile_counter(
+                    author.pk, 'subscribers_count', 1)
+        except IntegrityError:
             return Response(
                 {'errors': 'Уже подписаны!'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        Subscription.objects.create(user=user, author=author)
         serializer = SubscriptionSerializer(
-            author,
+            self.get_subscriptions_queryset().get(pk=author.pk),
             context={'request': request}
         )
         return Response(
@@ -82,11 +143,7 @@ class UserViewSet(viewsets.ModelViewSet):
         url_path='subscriptions'
     )
     def subscriptions(self, request):
-        authors_ids = Subscription.objects.filter(
-            user=request.user
-        ).values_list('author', flat=True)
-        qs = User.objects.filter(id__in=authors_ids)
-        page = self.paginate_queryset(qs)
+        page = self.paginate_queryset(self.get_subscriptions_queryset())
         serializer = SubscriptionSerializer(
             page, many=True, context={'request': request}
         )
@@ -94,15 +151,18 @@ class UserViewSet(viewsets.ModelViewSet):
 
     @subscribe.mapping.delete
     def unsubscribe(self, request, pk=None):
-        author = self.get_object()
-        qs = Subscription.objects.\
-            filter(user=request.user, author=author)
-        if not qs.exists():
+        """Число удалённых строк решает между 204 и 400."""
+        with transaction.atomic():
+            deleted, _ = Subscription.objects.filter(
+                user=request.user, author_id=pk).delete()
+            counters.change_profile_counter(
+                pk, 'subscribers_count', -deleted)
+        if not deleted:
+            self.get_object()
             return Response(
                 {'errors': 'Нет подписки!'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        qs.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(